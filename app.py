@@ -1,29 +1,80 @@
 # -*- coding: utf-8 -*-
-import os
+from __future__ import annotations  # 타입 힌트(pd.DataFrame 등)가 import를 일으키지 않도록
+import os, sys, subprocess, importlib, importlib.util
 from io import BytesIO
-import wave
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import streamlit as st
-import gspread
 from datetime import datetime
-import pytz 
-from urllib.parse import urlencode, quote
+from zoneinfo import ZoneInfo
+from urllib.parse import urlencode
 from textwrap import dedent
 import requests, time, json
+import asyncio, threading, uuid, hashlib, sqlite3, random, atexit
+from collections import deque, OrderedDict, Counter
+from itertools import combinations
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
-KST = pytz.timezone("Asia/Seoul")
+KST = ZoneInfo("Asia/Seoul")
 
 
-# OpenAI (가사 생성 옵션)
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
+# -----------------------------
+# 무거운 의존성은 처음 쓰는 순간에 import (공유 링크 화면/가사 화면은 안 씀)
+# -----------------------------
+class LazyModule:
+    """속성에 처음 접근할 때 실제 모듈을 import하는 대리 객체"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+np = LazyModule("numpy")            # 합성 오디오, 차트 색상
+pd = LazyModule("pandas")           # 대시보드/미러
+cm = LazyModule("matplotlib.cm")    # 대시보드 파이 차트
+gspread = LazyModule("gspread")     # 시트 연결/동기화
+
+# OpenAI (가사 생성 옵션) — 설치 여부만 확인하고 SDK는 클라이언트 만들 때 import
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "gspread", "openai")
+# import 시간 측정(서브프로세스)은 운영자만: 공개 배포에서 방문자가 인터프리터를 띄우지 못하게 기본 꺼짐
+IMPORT_PROFILE_ENABLED = os.environ.get("IMPORT_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+@st.cache_data(ttl=3600, max_entries=4, show_spinner=False)
+def import_time_report(modules=HEAVY_MODULES, top: int = 15) -> list[dict]:
+    """
+    `python -X importtime`을 별도 프로세스로 돌려 모듈별 import 비용(ms)을 표로 반환.
+    cumulative 기준 상위 top개. 새 워커의 콜드 스타트 비용을 그대로 재현한다.
+    결과는 1시간 캐시 (같은 환경에서 다시 재도 값이 거의 같음).
+    """
+    code = "import streamlit; " + "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, timeout=120,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, raw = line[len("import time:"):].split("|")
+        rows.append({
+            "module": raw.strip(),
+            "depth": (len(raw) - len(raw.lstrip()) - 1) // 2,  # 0 = 직접 import한 모듈
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cum_us) / 1000,
+        })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
 
 # --- Query Params helper ---
 def get_query_params():
@@ -32,6 +83,21 @@ def get_query_params():
     except Exception:
         return st.experimental_get_query_params()
 
+def set_query_param(key: str, value: str = ""):
+    """value가 비어 있으면 해당 파라미터 제거"""
+    try:
+        if value:
+            st.query_params[key] = value
+        else:
+            st.query_params.pop(key, None)
+    except Exception:
+        params = st.experimental_get_query_params()
+        if value:
+            params[key] = value
+        else:
+            params.pop(key, None)
+        st.experimental_set_query_params(**params)
+
 def get_query_param(qp, key: str) -> str:
     val = qp.get(key)
     if not val:
@@ -91,7 +157,7 @@ else:
     st_time = st.session_state["start_time"]
     # 이전 세션에서 naive로 저장된 경우 보정
     if getattr(st_time, "tzinfo", None) is None:
-        st.session_state["start_time"] = KST.localize(st_time)
+        st.session_state["start_time"] = st_time.replace(tzinfo=KST)
 # 세션 시간대 계산
 hour = datetime.now(KST).hour  # ★ KST
 if 6 <= hour < 12:
@@ -111,6 +177,9 @@ else:
     st.session_state["visit_count"] += 1
 if "sharing" not in st.session_state:
     st.session_state["sharing"] = False
+# Suno 작업 재접속(resume-by-id)용 세션 식별자
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
 
 
 # 다운로드 여부
@@ -179,18 +248,56 @@ def mbti_style(mbti: str):
 # -----------------------------
 # Google Sheets 연결
 # -----------------------------
-HEADERS = [
-  "timestamp","user_id","mbti","keywords","joy","energy","personal_line",
-  "satisfaction","mbti_match","played","lyrics_lines","lyrics",
-  # --- new: burnout light + post satisfaction ---
-  "bo_exhaust","bo_cynicism","bo_burden","bo_anger","bo_fatigue","bo_sleep",  
-  "burnout_score","burnout_level",              # 합계, 'low/moderate/high'
-  "would_return", "page_view_time","button_clicks","revisit","sharing","session_time","downloaded","download_clicks","audio_size_bytes", "vocal_gender"                          # 0~10, TRUE/FALSE
-]
+# 시트 스키마: 컬럼 순서 = 시트 헤더 순서. 값은 타입 종류
+#   datetime/str/list(","로 연결)/category/bool/int8·int16·int32
+# 시트 행 직렬화(build_sheet_row), 미러 저장(_parse_cell), DataFrame 타입(typed_frame)이 모두 여기서 나온다.
+SHEET_SCHEMA = {
+    "timestamp": "datetime",
+    "user_id": "str",
+    "mbti": "category",
+    "keywords": "list",
+    "joy": "int8",
+    "energy": "int8",
+    "personal_line": "str",
+    "satisfaction": "int8",
+    "mbti_match": "bool",
+    "played": "bool",
+    "lyrics_lines": "int16",
+    "lyrics": "str",
+    # --- new: burnout light + post satisfaction ---
+    "bo_exhaust": "int8",
+    "bo_cynicism": "int8",
+    "bo_burden": "int8",
+    "bo_anger": "int8",
+    "bo_fatigue": "int8",
+    "bo_sleep": "int8",
+    "burnout_score": "int8",       # 합계
+    "burnout_level": "category",   # 'low/moderate/high'
+    "would_return": "bool",
+    "page_view_time": "int32",
+    "button_clicks": "int16",
+    "revisit": "bool",
+    "sharing": "bool",
+    "session_time": "category",
+    "downloaded": "bool",
+    "download_clicks": "int16",
+    "audio_size_bytes": "int32",
+    "vocal_gender": "category",
+    "row_id": "str",               # WAL 재전송 중복 제거용
+}
+HEADERS = list(SHEET_SCHEMA)
+# payload에 없어도 되는 컬럼의 기본값 (나머지는 필수)
+SHEET_DEFAULTS = {
+    "user_id": "",
+    "downloaded": False,
+    "download_clicks": 0,
+    "audio_size_bytes": 0,
+    "vocal_gender": "상관없음",
+}
 
 
-@st.cache_resource
 def connect_gsheet(sheet_name: str):
+    """서비스 계정 인증 + 시트 열기. 실패하면 예외 (UI 표시는 호출 쪽에서)"""
     # 1) secrets 필수 체크
     if "gcp_service_account" not in st.secrets:
         raise RuntimeError(
@@ -198,61 +305,775 @@ def connect_gsheet(sheet_name: str):
         )
 
     # 2) gspread + google-auth로 연결
-    try:
-        gc = gspread.service_account_from_dict(dict(st.secrets["gcp_service_account"]))
-        sh = gc.open(sheet_name)
-        return sh.sheet1
-    except Exception as e:
-        # 앱이 통째로 죽지 않도록 메시지 표기
-        st.error(f"Google Sheets 연결 실패: {e}")
-        raise
+    gc = gspread.service_account_from_dict(dict(st.secrets["gcp_service_account"]))
+    sh = gc.open(sheet_name)
+    return sh.sheet1
 
 
 SHEET_NAME = "mbti_song_data"  # 너의 구글시트 이름
-sheet = connect_gsheet(SHEET_NAME)
-
-def append_row_to_sheet(sheet, payload: dict):
-    """Google Sheet에 한 행 추가. HEADERS 순서와 1:1 매칭"""
-    row = [
-        # 1~12
-        datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S"),
-        payload.get("user_id",""),
-        payload["mbti"],
-        ",".join(payload["keywords"]),
-        payload["joy"],
-        payload["energy"],
-        payload["personal_line"],
-        payload["satisfaction"],
-        payload["mbti_match"],
-        payload["played"],
-        payload["lyrics_lines"],
-        payload["lyrics"],
-
-        # 13~20 (번아웃 관련)
-        payload["bo_exhaust"],
-        payload["bo_cynicism"],
-        payload["bo_burden"],
-        payload["bo_anger"],
-        payload["bo_fatigue"],
-        payload["bo_sleep"],
-        payload["burnout_score"],
-        payload["burnout_level"],
-
-        # 21 (would_return)
-        payload["would_return"],
-
-        # 22~27 (신규 6개 지표: 필수!)
-        payload["page_view_time"],
-        payload["button_clicks"],
-        payload["revisit"],
-        payload["sharing"],
-        payload["session_time"],
-        payload.get("downloaded", False),
-        payload.get("download_clicks", 0),
-        payload.get("audio_size_bytes", 0),
-        payload.get("vocal_gender", "상관없음"),
-    ]
-    sheet.append_row(row, value_input_option="USER_ENTERED")
+
+
+def ensure_sheet_header(ws):
+    """
+    1행 헤더를 HEADERS와 맞춤. 행은 SHEET_SCHEMA 순서로 그대로 붙이므로 위치가 다르면 쓰지 않는다.
+    - 빈 시트: 헤더 작성
+    - row_id 이전 시트(마지막 row_id만 없음): 끝에 row_id 열 추가
+    - HEADERS 뒤에 사람이 붙인 열은 허용
+    """
+    header = ws.row_values(1)
+    if header[:len(HEADERS)] == HEADERS:
+        return
+    if not header:
+        ws.append_row(HEADERS, value_input_option="RAW")
+    elif header == HEADERS[:-1]:
+        if ws.col_count < len(HEADERS):
+            ws.add_cols(len(HEADERS) - ws.col_count)
+        ws.update_cell(1, len(HEADERS), "row_id")
+    else:
+        raise RuntimeError(
+            "시트 헤더가 앱 스키마와 다릅니다. README의 '데이터 스키마(시트)' 순서로 1행을 맞춰 주세요."
+        )
+
+
+def _is_auth_error(e: Exception) -> bool:
+    """토큰 만료/인증 실패 → 재연결 필요"""
+    code = getattr(e, "code", None)
+    if code is None and getattr(e, "response", None) is not None:
+        code = getattr(e.response, "status_code", None)
+    text = f"{type(e).__name__} {e}".lower()
+    return code == 401 or "refresherror" in text or "unauthenticated" in text or "invalid_grant" in text
+
+
+class SheetConnection:
+    """
+    워크시트 핸들을 처음 필요할 때 백그라운드에서 연결 (import/첫 화면에서는 Google API 호출 없음).
+    상태: idle → connecting → ok | error. 인증 만료가 보고되면 idle로 돌아가 다음 get()에서 재연결.
+    """
+
+    def __init__(self, sheet_name: str, retry_after: float = 30.0):
+        self.sheet_name = sheet_name
+        self.retry_after = retry_after  # error 상태에서 재시도까지 최소 간격
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ws = None
+        self.state = "idle"
+        self.error: str | None = None
+        self.connected_at: float | None = None
+        self.failed_at: float | None = None
+        self.connects = 0
+
+    def _connect(self):
+        try:
+            ws = connect_gsheet(self.sheet_name)
+            ensure_sheet_header(ws)  # 이전 시트에 row_id 열 추가 (중복 제거가 이 열 위치를 읽음)
+            with self._lock:
+                self._ws, self.state, self.error = ws, "ok", None
+                self.connected_at = time.time()
+                self.connects += 1
+        except Exception as e:
+            with self._lock:
+                self._ws, self.state, self.error = None, "error", str(e)[:200]
+                self.failed_at = time.time()
+        finally:
+            self._ready.set()
+
+    def start(self):
+        """연결이 없으면 백그라운드 연결 시작 (이미 연결 중/완료면 아무것도 안 함)"""
+        with self._lock:
+            if self.state in ("connecting", "ok"):
+                return
+            if self.state == "error" and time.time() - (self.failed_at or 0) < self.retry_after:
+                return
+            self.state = "connecting"
+            self._ready.clear()
+        threading.Thread(target=self._connect, name="gsheet-connect", daemon=True).start()
+
+    def get(self, timeout: float = 30.0):
+        """워크시트 반환. timeout 안에 연결되지 않으면 RuntimeError"""
+        self.start()
+        self._ready.wait(timeout)
+        with self._lock:
+            if self._ws is not None:
+                return self._ws
+            raise RuntimeError(f"Google Sheets 연결 실패: {self.error or '연결 중'}")
+
+    def report_error(self, e: Exception):
+        """시트 호출 실패를 알려 줌. 인증 오류면 핸들을 버리고 다음 get()에서 재연결"""
+        if _is_auth_error(e):
+            with self._lock:
+                self._ws, self.state, self.error = None, "idle", str(e)[:200]
+
+    def reconnect(self):
+        with self._lock:
+            self._ws, self.state, self.failed_at = None, "idle", None
+        self.start()
+
+    def health(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "error": self.error,
+                "connected_at": self.connected_at,
+                "connects": self.connects,
+            }
+
+
+@st.cache_resource
+def get_sheet_connection() -> SheetConnection:
+    return SheetConnection(SHEET_NAME)
+
+def _encode_cell(kind: str, value):
+    """파이썬 값 → 시트 셀 값 (SHEET_SCHEMA 타입 기준)"""
+    if kind == "list":
+        return ",".join(value)
+    if kind == "bool":
+        return bool(value)
+    if kind.startswith("int"):
+        return int(value)
+    return value
+
+
+def build_sheet_row(payload: dict, row_id: str = "") -> list:
+    """payload → 시트 한 행. SHEET_SCHEMA 순서와 1:1 매칭 (timestamp는 호출 시점)"""
+    row = []
+    for col, kind in SHEET_SCHEMA.items():
+        if col == "timestamp":
+            row.append(datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S"))
+        elif col == "row_id":
+            row.append(row_id)
+        elif col in SHEET_DEFAULTS:
+            row.append(_encode_cell(kind, payload.get(col, SHEET_DEFAULTS[col])))
+        else:
+            row.append(_encode_cell(kind, payload[col]))
+    return row
+
+
+def _is_quota_error(e: Exception) -> bool:
+    """Sheets 쓰기 할당량(429) 초과 여부"""
+    code = getattr(e, "code", None)
+    if code is None and getattr(e, "response", None) is not None:
+        code = getattr(e.response, "status_code", None)
+    return code == 429 or "quota" in str(e).lower() or "rate_limit" in str(e).lower()
+
+
+ANALYTICS_WAL_DB = os.environ.get("ANALYTICS_WAL_DB", "analytics_wal.sqlite3")
+# 시트에 반영된 행을 WAL에 남겨두는 기간 (지나면 삭제, 기본 7일)
+ANALYTICS_WAL_RETENTION_SEC = float(os.environ.get("ANALYTICS_WAL_RETENTION_SEC", 7 * 24 * 3600))
+
+
+class AnalyticsWAL:
+    """
+    로그 행의 로컬 선기록(WAL). 모든 행은 시트보다 먼저 여기에 저장되고,
+    시트에 반영되면 synced_at이 채워지고, retention초가 지나면 삭제된다.
+    시트 장애 중 쌓인 행은 나중에 재전송.
+    """
+
+    def __init__(self, path: str = ANALYTICS_WAL_DB, retention: float = ANALYTICS_WAL_RETENTION_SEC):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_wal (
+                    row_id     TEXT PRIMARY KEY,
+                    row_json   TEXT,
+                    created_at REAL,
+                    synced_at  REAL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_wal_pending ON analytics_wal (synced_at, created_at)"
+            )
+
+    def append(self, row_id: str, row: list):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO analytics_wal (row_id, row_json, created_at) VALUES (?, ?, ?)",
+                (row_id, json.dumps(row, ensure_ascii=False), time.time()),
+            )
+
+    def pending(self, limit: int) -> list[tuple[str, list]]:
+        """아직 시트에 반영되지 않은 행 (오래된 순)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row_id, row_json FROM analytics_wal WHERE synced_at IS NULL "
+                "ORDER BY created_at LIMIT ?", (limit,)
+            ).fetchall()
+        return [(rid, json.loads(js)) for rid, js in rows]
+
+    def mark_synced(self, row_ids: list[str]):
+        """시트 반영 표시 + 보관 기간이 지난 반영 행 삭제 (synced_at 인덱스 범위 삭제)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE analytics_wal SET synced_at = ? WHERE row_id = ?",
+                [(now, rid) for rid in row_ids],
+            )
+            self._conn.execute(
+                "DELETE FROM analytics_wal WHERE synced_at IS NOT NULL AND synced_at < ?",
+                (now - self.retention,),
+            )
+
+    def pending_count(self) -> int:
+        """미전송 행 수 (idx_wal_pending만 읽음 → 이력이 쌓여도 일정)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM analytics_wal WHERE synced_at IS NULL"
+            ).fetchone()[0]
+
+    def counts(self) -> dict:
+        with self._lock:
+            synced = self._conn.execute(
+                "SELECT COUNT(*) FROM analytics_wal WHERE synced_at IS NOT NULL"
+            ).fetchone()[0]
+        return {"wal_pending": self.pending_count(), "wal_synced": synced}
+
+
+class SheetLogger:
+    """
+    로그 행을 WAL에 먼저 쓰고, 백그라운드 스레드가 append_rows로 묶어서 시트에 재전송.
+    - 미전송 행이 batch_size개 이상이거나 flush_interval초가 지나면 전송
+    - row_id로 중복 제거: 시트에 이미 있는 row_id는 다시 쓰지 않음 (재전송이 멱등)
+    - 실패 시 지수 백오프 (할당량 429 포함). 행은 WAL에 남아 있다가 복구 후 일괄 재전송
+    - 프로세스 종료 시(atexit) 한 번 더 전송 시도
+    - 새 행을 시트에 쓰면 on_sent() 호출 (대시보드 미러의 TTL을 만료시켜 바로 증분 동기화)
+    공유 버튼 클릭은 WAL에 쓰자마자 반환된다.
+    """
+
+    def __init__(self, wal: AnalyticsWAL, conn: SheetConnection, batch_size: int = 20,
+                 flush_interval: float = 5.0, max_batch: int = 500, max_backoff: float = 120.0,
+                 on_sent=None):
+        self.wal = wal
+        self.conn = conn
+        self.on_sent = on_sent
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch  # 장애 후 백필 시 한 번에 보낼 최대 행 수
+        self.max_backoff = max_backoff
+        self._delay = 0.0
+        self._known_ids: set[str] | None = None  # 시트에 이미 있는 row_id
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counts = {"logged": 0, "sent": 0, "deduped": 0, "batches": 0,
+                        "failures": 0, "quota_backoffs": 0}
+        self.last_error: str | None = None
+        self._thread = threading.Thread(target=self._run, name="sheet-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, payload: dict) -> str:
+        row_id = uuid.uuid4().hex
+        self.wal.append(row_id, build_sheet_row(payload, row_id))
+        self._bump("logged")
+        if self.wal.pending_count() >= self.batch_size:
+            self._wake.set()
+        return row_id
+
+    def wake(self):
+        """대기 없이 바로 재전송 시도"""
+        self._delay = 0.0
+        self._wake.set()
+
+    def _bump(self, key: str, n: int = 1):
+        with self._lock:
+            self._counts[key] += n
+
+    def _sheet_row_ids(self, sheet) -> set[str]:
+        if self._known_ids is None:
+            # 열 위치는 연결 시 ensure_sheet_header()가 맞춰 둠
+            col = sheet.col_values(HEADERS.index("row_id") + 1)
+            self._known_ids = set(col[1:])
+        return self._known_ids
+
+    def _send(self, batch: list[tuple[str, list]]) -> bool:
+        try:
+            sheet = self.conn.get()
+            known = self._sheet_row_ids(sheet)
+            fresh = [row for rid, row in batch if rid not in known]
+            if fresh:
+                sheet.append_rows(fresh, value_input_option="USER_ENTERED")
+                self._bump("batches")
+                if self.on_sent is not None:
+                    self.on_sent()
+            known.update(rid for rid, _ in batch)
+            self.wal.mark_synced([rid for rid, _ in batch])
+            self._bump("sent", len(fresh))
+            self._bump("deduped", len(batch) - len(fresh))
+            self._delay = 0.0
+            self.last_error = None
+            return True
+        except Exception as e:
+            # 쓰기가 실제로는 반영됐을 수 있으니 다음 시도에서 시트의 row_id를 다시 읽는다
+            self._known_ids = None
+            self.conn.report_error(e)
+            self._bump("failures")
+            if _is_quota_error(e):
+                self._bump("quota_backoffs")
+            self.last_error = str(e)[:200]
+            self._delay = min(self.max_backoff, max(1.0, self._delay * 2))
+            return False
+
+    def replay(self) -> int:
+        """WAL의 미전송 행을 모두 시트로 보냄. 보낸(또는 이미 있던) 행 수 반환"""
+        done = 0
+        with self._send_lock:
+            while True:
+                batch = self.wal.pending(self.max_batch)
+                if not batch or not self._send(batch):
+                    return done
+                done += len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._delay:
+                self._stop.wait(self._delay * random.uniform(0.8, 1.2))
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            if self.wal.pending_count():
+                self.replay()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.replay()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counts)
+        out.update(self.wal.counts())
+        out["backoff_sec"] = round(self._delay, 1)
+        out["last_error"] = self.last_error
+        return out
+
+
+@st.cache_resource
+def get_sheet_logger() -> SheetLogger:
+    return SheetLogger(AnalyticsWAL(ANALYTICS_WAL_DB), get_sheet_connection(),
+                       on_sent=get_sheet_mirror().expire)
+
+
+# -----------------------------
+# 대시보드용 로컬 미러 (시트 → SQLite, 증분 동기화)
+# -----------------------------
+SHEET_MIRROR_DB = os.environ.get("SHEET_MIRROR_DB", "sheet_mirror.sqlite3")
+
+
+BO_COLS = ["bo_exhaust", "bo_cynicism", "bo_burden", "bo_anger", "bo_fatigue", "bo_sleep"]
+BURNOUT_MIN_SCORE = 6   # 6문항 × 1점
+BURNOUT_MAX_SCORE = 30  # 6문항 × 5점
+AGG_METRICS = ("rows", "burnout_score", "anxiety_pct", "satisfaction", "played", "mbti_match")
+
+
+def _is_true(value) -> bool:
+    """시트 문자열("TRUE"/"1") 또는 미러의 0/1 → bool"""
+    if isinstance(value, str):
+        return value.lower() in ("true", "1")
+    return value is not None and bool(value)
+
+
+def _row_metrics(rec: dict) -> dict:
+    """미러 한 행 → 집계 지표 값 (None이면 해당 지표 집계에서 제외)"""
+    score = rec.get("burnout_score")
+    if score is None:  # burnout_score가 비었으면 개별 문항 합산으로 보정
+        items = [rec.get(c) for c in BO_COLS]
+        score = sum(items) if all(v is not None for v in items) else None
+    anxiety = None
+    if score is not None:
+        pct = (score - BURNOUT_MIN_SCORE) / (BURNOUT_MAX_SCORE - BURNOUT_MIN_SCORE) * 100
+        anxiety = min(100.0, max(0.0, pct))
+    return {
+        "rows": 1.0,
+        "burnout_score": score,
+        "anxiety_pct": anxiety,
+        "satisfaction": rec.get("satisfaction"),
+        "played": float(_is_true(rec.get("played"))),
+        "mbti_match": float(_is_true(rec.get("mbti_match"))),
+    }
+
+
+def _agg_deltas(records) -> dict:
+    """행들 → {(scope, key, metric): [n, sum, sumsq]} (scope: mbti / day)"""
+    out: dict[tuple, list] = {}
+    for rec in records:
+        keys = (("mbti", rec.get("mbti") or ""), ("day", (rec.get("timestamp") or "")[:10]))
+        for metric, v in _row_metrics(rec).items():
+            if v is None:
+                continue
+            for scope, key in keys:
+                acc = out.setdefault((scope, key, metric), [0, 0.0, 0.0])
+                acc[0] += 1
+                acc[1] += v
+                acc[2] += v * v
+    return out
+
+
+def _keyword_set(value) -> set[str]:
+    """keywords 셀 → 키워드 집합. str.get_dummies(sep=",")와 같은 규칙 (공백 유지, 빈 조각도 키워드)"""
+    return set(str(value).split(",")) if value is not None else set()
+
+
+def _keyword_deltas(records) -> tuple[Counter, Counter]:
+    """행들 → (MBTI×키워드 행 수, 키워드×키워드 동시 출현 수). 쌍은 빈 키워드 제외, (a < b)"""
+    by_mbti, pairs = Counter(), Counter()
+    for rec in records:
+        kws = _keyword_set(rec.get("keywords"))
+        mbti = rec.get("mbti") or ""
+        for kw in kws:
+            by_mbti[(mbti, kw)] += 1
+        pairs.update(combinations(sorted(k for k in kws if k), 2))
+    return by_mbti, pairs
+
+
+_SQL_TYPES = {"bool": "INTEGER", "int8": "INTEGER", "int16": "INTEGER", "int32": "INTEGER"}
+_PANDAS_DTYPES = {"category": "category", "bool": "boolean",
+                  "int8": "Int8", "int16": "Int16", "int32": "Int32"}
+
+
+def _parse_cell(col: str, value):
+    """시트 셀(문자열) → 미러 컬럼 값. 정수/불리언은 int (비었거나 깨진 값은 None)"""
+    kind = SHEET_SCHEMA[col]
+    if kind not in _SQL_TYPES:
+        return "" if value is None else str(value)
+    if value in ("", None):
+        return None
+    if kind == "bool":
+        return int(_is_true(value))
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def typed_frame(raw: pd.DataFrame) -> pd.DataFrame:
+    """미러에서 읽은 DataFrame → SHEET_SCHEMA 타입 (category/boolean/Int8…, 결측은 <NA>)"""
+    out = raw.copy()
+    for col, kind in SHEET_SCHEMA.items():
+        if col not in out.columns:
+            continue
+        if kind == "datetime":
+            out[col] = pd.to_datetime(out[col], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+        elif kind == "bool":
+            out[col] = out[col].map({1: True, 0: False}).astype("boolean")
+        elif kind in _PANDAS_DTYPES:
+            out[col] = out[col].astype(_PANDAS_DTYPES[kind])
+    return out
+
+
+class SheetMirror:
+    """
+    시트 행을 로컬 SQLite에 타입 있는 컬럼(HEADERS 기준)으로 복제.
+    - sync(): ttl초마다 마지막으로 받은 행 이후만 가져옴 (A{n}:끝)
+    - full_ttl초마다 또는 시트 헤더가 바뀌면 전체 재적재 (삭제/수정 반영)
+    - tail(n): 마지막 n행만 읽어 스키마 타입으로 (미러 전체를 메모리에 올리지 않음)
+    - mirror_agg: MBTI별/일별 (count, sum, sumsq)를 적재 시점에 갱신 → 대시보드는 O(#MBTI)
+    - mirror_kw / mirror_kw_pair: MBTI×키워드, 키워드×키워드 희소 카운트 (get_dummies 대체)
+    시트가 죽어 있어도 마지막으로 받은 데이터로 대시보드를 그릴 수 있다.
+    집계는 시트를 거쳐서만 갱신된다 (WAL 행을 직접 더하면 sync 때 같은 행이 두 번 집계됨).
+    이 프로세스가 쓴 행은 시트 전송(flush_interval) 직후 expire()로 다음 화면에서 반영되고,
+    다른 프로세스가 쓴 행은 최대 ttl초 늦게 보인다.
+    """
+
+    def __init__(self, path: str = SHEET_MIRROR_DB, ttl: float = 60.0, full_ttl: float = 6 * 3600):
+        self.ttl = ttl
+        self.full_ttl = full_ttl
+        self._lock = threading.Lock()
+        self.last_error: str | None = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        cols = ", ".join(f'"{c}" {_SQL_TYPES.get(kind, "TEXT")}' for c, kind in SHEET_SCHEMA.items())
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS mirror_meta (key TEXT PRIMARY KEY, value TEXT)")
+            if self._meta("schema") != SHEET_SCHEMA:
+                # 스키마가 바뀌면 미러를 비우고 다음 sync에서 전체 재적재
+                for table in ("sheet_rows", "mirror_agg", "mirror_kw", "mirror_kw_pair"):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._conn.execute("DELETE FROM mirror_meta")
+                self._set_meta(schema=SHEET_SCHEMA)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS sheet_rows (_rownum INTEGER PRIMARY KEY, {cols})")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS mirror_agg (
+                    scope  TEXT,
+                    key    TEXT,
+                    metric TEXT,
+                    n      INTEGER,
+                    sum    REAL,
+                    sumsq  REAL,
+                    PRIMARY KEY (scope, key, metric)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS mirror_kw (
+                    mbti    TEXT,
+                    keyword TEXT,
+                    n       INTEGER,
+                    PRIMARY KEY (mbti, keyword)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS mirror_kw_pair (
+                    kw_a TEXT,
+                    kw_b TEXT,
+                    n    INTEGER,
+                    PRIMARY KEY (kw_a, kw_b)
+                )
+            """)
+
+    def _meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM mirror_meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, **kv):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO mirror_meta (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False)) for k, v in kv.items()],
+        )
+
+    def _ingest(self, header: list[str], values: list[list], start_row: int) -> int:
+        """시트 행들(문자열 리스트)을 HEADERS 컬럼으로 파싱해 저장. 저장한 행 수 반환"""
+        idx = {c: header.index(c) for c in HEADERS if c in header}
+        out = []
+        for i, raw in enumerate(values):
+            if not any(str(v).strip() for v in raw):
+                continue
+            cells = [
+                _parse_cell(c, raw[idx[c]] if c in idx and idx[c] < len(raw) else None)
+                for c in HEADERS
+            ]
+            out.append([start_row + i, *cells])
+        marks = ", ".join("?" * (len(HEADERS) + 1))
+        self._conn.executemany(f"INSERT OR REPLACE INTO sheet_rows VALUES ({marks})", out)
+        deltas = _agg_deltas(dict(zip(HEADERS, row[1:])) for row in out)
+        self._conn.executemany(
+            "INSERT INTO mirror_agg (scope, key, metric, n, sum, sumsq) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (scope, key, metric) DO UPDATE SET "
+            "n = n + excluded.n, sum = sum + excluded.sum, sumsq = sumsq + excluded.sumsq",
+            [(*k, *v) for k, v in deltas.items()],
+        )
+        by_mbti, pairs = _keyword_deltas(dict(zip(HEADERS, row[1:])) for row in out)
+        self._conn.executemany(
+            "INSERT INTO mirror_kw (mbti, keyword, n) VALUES (?, ?, ?) "
+            "ON CONFLICT (mbti, keyword) DO UPDATE SET n = n + excluded.n",
+            [(*k, n) for k, n in by_mbti.items()],
+        )
+        self._conn.executemany(
+            "INSERT INTO mirror_kw_pair (kw_a, kw_b, n) VALUES (?, ?, ?) "
+            "ON CONFLICT (kw_a, kw_b) DO UPDATE SET n = n + excluded.n",
+            [(*k, n) for k, n in pairs.items()],
+        )
+        return len(out)
+
+    def expire(self):
+        """TTL을 만료시켜 다음 sync()가 바로 시트를 읽게 함 (시트 호출은 그때 한 번)"""
+        with self._lock, self._conn:
+            self._set_meta(stale=True)
+
+    def sync(self, sheet_fn, force: bool = False) -> int:
+        """필요하면 시트에서 새 행을 가져옴. 새로 받은 행 수 반환"""
+        with self._lock:
+            now = time.time()
+            if (not force and not self._meta("stale", False)
+                    and now - self._meta("synced_at", 0) < self.ttl):
+                return 0
+            try:
+                sheet = sheet_fn()
+                header = sheet.row_values(1)
+                full = (
+                    header != self._meta("header")
+                    or now - self._meta("full_at", 0) >= self.full_ttl
+                )
+                start = 2 if full else self._meta("next_row", 2)
+                last_col = gspread.utils.rowcol_to_a1(1, max(1, len(header)))[:-1]
+                values = sheet.get_values(f"A{start}:{last_col}")
+                with self._conn:
+                    if full:
+                        self._conn.execute("DELETE FROM sheet_rows")
+                        self._conn.execute("DELETE FROM mirror_agg")
+                        self._conn.execute("DELETE FROM mirror_kw")
+                        self._conn.execute("DELETE FROM mirror_kw_pair")
+                    added = self._ingest(header, values, start)
+                    rows = self._conn.execute("SELECT COUNT(*) FROM sheet_rows").fetchone()[0]
+                    meta = {"header": header, "synced_at": now, "stale": False, "rows": rows,
+                            "next_row": start + len(values)}
+                    if full:
+                        meta["full_at"] = now
+                    self._set_meta(**meta)
+                self.last_error = None
+                return added
+            except Exception as e:
+                self.last_error = str(e)[:200]
+                raise
+
+    def _raw_frame(self) -> pd.DataFrame:
+        """미러에 저장된 값 그대로 (SQLite 타입)"""
+        cols = ", ".join(f'"{c}"' for c in HEADERS)
+        return pd.read_sql_query(f"SELECT {cols} FROM sheet_rows ORDER BY _rownum", self._conn)
+
+    def tail(self, n: int = 5) -> pd.DataFrame:
+        """마지막 n행을 스키마 타입 DataFrame으로 (rowid 역순 LIMIT → 미러 크기와 무관)"""
+        cols = ", ".join(f'"{c}"' for c in HEADERS)
+        with self._lock:
+            raw = pd.read_sql_query(
+                f"SELECT _rownum, {cols} FROM sheet_rows ORDER BY _rownum DESC LIMIT ?",
+                self._conn, params=(n,),
+            )
+        return typed_frame(raw.iloc[::-1].set_index("_rownum"))
+
+    def version(self) -> tuple:
+        """데이터 버전 (행 수, 마지막 timestamp, 전체 재적재 시각) — 차트 캐시 키"""
+        with self._lock:
+            last = self._conn.execute(
+                "SELECT timestamp FROM sheet_rows ORDER BY _rownum DESC LIMIT 1"
+            ).fetchone()
+            return (self._meta("rows", 0), last[0] if last else None, self._meta("full_at", 0))
+
+    def joy_energy_points(self) -> pd.DataFrame:
+        """
+        (joy, energy, mbti)별 행 수 — 같은 좌표의 행을 점 하나로 합친다.
+        joy/energy는 0~100 슬라이더라 점 개수는 행 수보다 적을 뿐 행 수에 따라 늘어난다
+        (상한 101 × 101 × MBTI 수).
+        """
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT joy, energy, mbti, COUNT(*) AS rows FROM sheet_rows "
+                "WHERE joy IS NOT NULL AND energy IS NOT NULL GROUP BY joy, energy, mbti",
+                self._conn,
+            )
+
+    def _agg_rows(self, scope: str) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT key, metric, n, sum, sumsq FROM mirror_agg WHERE scope = ?",
+                self._conn, params=(scope,),
+            )
+
+    def aggregates(self, scope: str = "mbti") -> pd.DataFrame:
+        """index=key(MBTI 또는 날짜), 컬럼=지표별 평균 + count(행 수)"""
+        agg = self._agg_rows(scope)
+        metrics = [m for m in AGG_METRICS if m != "rows"]
+        if agg.empty:
+            return pd.DataFrame(columns=[*metrics, "count"])
+        agg["mean"] = agg["sum"] / agg["n"]
+        out = agg.pivot(index="key", columns="metric", values="mean").reindex(columns=metrics)
+        out["count"] = agg[agg["metric"] == "rows"].set_index("key")["n"]
+        return out
+
+    def overall(self, metric: str) -> float | None:
+        """전체 평균 (MBTI별 합계를 합산)"""
+        agg = self._agg_rows("mbti")
+        agg = agg[agg["metric"] == metric]
+        n = agg["n"].sum()
+        return float(agg["sum"].sum() / n) if n else None
+
+    def keyword_table(self) -> pd.DataFrame:
+        """MBTI × 키워드 행 수 표 (키워드가 없는 MBTI도 0으로 포함). 크기는 #MBTI × #키워드"""
+        with self._lock:
+            kw = pd.read_sql_query("SELECT mbti, keyword, n FROM mirror_kw", self._conn)
+            mbtis = [r[0] for r in self._conn.execute(
+                "SELECT key FROM mirror_agg WHERE scope = 'mbti' AND metric = 'rows'"
+            )]
+        table = kw.pivot(index="mbti", columns="keyword", values="n")
+        table = table.reindex(index=sorted(set(mbtis) | set(table.index)), columns=sorted(table.columns))
+        table.index.name = "mbti"
+        table.columns.name = None
+        return table.fillna(0).astype("int64")
+
+    def top_keywords(self, mbti: str, k: int = 5) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT keyword, n FROM mirror_kw WHERE mbti = ? AND keyword != '' "
+                "ORDER BY n DESC, keyword LIMIT ?", (mbti, k),
+            ).fetchall()
+
+    def top_pairs(self, k: int = 10, keyword: str | None = None) -> list[tuple[str, str, int]]:
+        """함께 자주 쓰인 키워드 쌍 (keyword를 주면 그 키워드가 포함된 쌍만)"""
+        sql, params = "SELECT kw_a, kw_b, n FROM mirror_kw_pair", ()
+        if keyword is not None:
+            sql, params = sql + " WHERE kw_a = ? OR kw_b = ?", (keyword, keyword)
+        with self._lock:
+            return self._conn.execute(sql + " ORDER BY n DESC, kw_a, kw_b LIMIT ?", (*params, k)).fetchall()
+
+    def check_aggregates(self, tol: float = 1e-6) -> list[str]:
+        """미러 전체로 다시 계산한 값과 집계 테이블 비교. 불일치 목록 반환 (비면 정상)"""
+        with self._lock:
+            raw = self._raw_frame()
+        expected = _agg_deltas(raw.astype(object).where(raw.notna(), None).to_dict("records"))
+        actual = {}
+        for scope in ("mbti", "day"):
+            for r in self._agg_rows(scope).itertuples(index=False):
+                actual[(scope, r.key, r.metric)] = [r.n, r.sum, r.sumsq]
+        problems = []
+        for k in sorted(set(expected) | set(actual)):
+            e, a = expected.get(k), actual.get(k)
+            if e is None or a is None or e[0] != a[0] or any(
+                abs(x - y) > tol * max(1.0, abs(x)) for x, y in zip(e[1:], a[1:])
+            ):
+                problems.append(f"{k}: expected={e} actual={a}")
+
+        if not raw.empty:
+            dummies = raw["keywords"].str.get_dummies(sep=",")
+            expected_kw = pd.concat([raw["mbti"], dummies], axis=1).groupby("mbti").sum()
+            try:
+                pd.testing.assert_frame_equal(
+                    expected_kw, self.keyword_table(), check_dtype=False, check_names=False
+                )
+            except AssertionError as e:
+                problems.append(f"keywords: {str(e).splitlines()[0]}")
+        return problems
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": self._meta("rows", 0),
+                "synced_at": self._meta("synced_at"),
+                "last_error": self.last_error,
+            }
+
+
+@st.cache_resource
+def get_sheet_mirror() -> SheetMirror:
+    return SheetMirror(SHEET_MIRROR_DB)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def dashboard_data(_mirror: SheetMirror, version: tuple) -> dict:
+    """데이터 버전별 대시보드 입력 (세션 간 공유). 버전이 그대로면 미러를 다시 읽지 않음"""
+    return {
+        "agg": _mirror.aggregates("mbti"),
+        "daily": _mirror.aggregates("day")["count"].sort_index(),
+        "anxiety": _mirror.overall("anxiety_pct"),
+        "played": _mirror.overall("played"),
+        "mbti_match": _mirror.overall("mbti_match"),
+        "keywords": _mirror.keyword_table(),
+        "pairs": _mirror.top_pairs(10),
+        "points": _mirror.joy_energy_points(),
+        "tail": _mirror.tail(5),
+    }
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def render_burnout_pie(version: tuple, labels: tuple, values: tuple) -> bytes:
+    """MBTI별 평균 번아웃 파이 차트 → PNG bytes (데이터 버전별 캐시)"""
+    from matplotlib.figure import Figure
+
+    # pyplot 전역 registry를 거치지 않는 Figure라 렌더 후 참조만 끊으면 메모리가 회수된다
+    fig = Figure()
+    ax = fig.subplots()
+    # 팔레트 색상 생성 (예: Set3)
+    colors = cm.Set3(np.linspace(0, 1, len(values)))
+    ax.pie(
+        values,
+        labels=labels,
+        autopct="%1.1f%%",
+        startangle=90,
+        counterclock=False,
+        colors=colors
+    )
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    fig.clear()
+    return buf.getvalue()
 
 
 # -----------------------------
@@ -405,6 +1226,203 @@ def burnout_feedback(level: str) -> str:
         return "☀️ 맑음 : 컨디션이 비교적 안정적이시네요. 🌿 음악으로 지금의 에너지를 더 채워보세요!"
 
 
+# -----------------------------
+# 공용 HTTP 레이어 (커넥션 풀/재시도/타임아웃)
+# -----------------------------
+# 엔드포인트별 (connect, read) 타임아웃(초)
+HTTP_TIMEOUTS = {
+    "suno.generate":    (10, 30),
+    "suno.record_info": (5, 20),
+    "audio":            (10, 120),
+    "openai":           (10, 60),
+}
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpLayer:
+    """
+    프로세스 전체가 공유하는 HTTP 클라이언트 모음.
+    - requests.Session + HTTPAdapter 커넥션 풀 (keep-alive, 429/5xx 재시도 + Retry-After 존중)
+    - OpenAI 클라이언트는 api_key별로 1개만 만들어 재사용
+    - Suno 엔진(httpx.AsyncClient)도 같은 타임아웃/재시도 정책(arequest)을 사용
+    - metrics(): 엔드포인트별 요청/재시도/에러 수 + 풀 상태
+    """
+
+    def __init__(self, pool_size: int = 32, retries: int = 3, backoff: float = 0.5):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=backoff,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),  # POST(생성 요청)는 중복 과금 위험 → 재시도 안 함
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._openai = {}
+        self._counts: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, endpoint: str, key: str = "requests", n: int = 1):
+        with self._lock:
+            c = self._counts.setdefault(endpoint, {"requests": 0, "retries": 0, "errors": 0})
+            c[key] += n
+
+    # ---- 동기(requests) ----
+    def request(self, endpoint: str, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", HTTP_TIMEOUTS[endpoint])
+        self._count(endpoint)
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._count(endpoint, "errors")
+            raise
+        history = getattr(getattr(r.raw, "retries", None), "history", None) or ()
+        if history:
+            self._count(endpoint, "retries", len(history))
+        return r
+
+    def get(self, endpoint: str, url: str, **kwargs) -> requests.Response:
+        return self.request(endpoint, "GET", url, **kwargs)
+
+    # ---- 비동기(httpx, Suno 엔진 루프 안에서 사용) ----
+    def async_client(self, base_url: str = "") -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(20.0, connect=10.0),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    def _retry_delay(self, resp: httpx.Response, attempt: int) -> float:
+        value = resp.headers.get("Retry-After")
+        if value:
+            try:
+                return min(30.0, float(value))
+            except ValueError:
+                try:
+                    return min(30.0, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+                except Exception:
+                    pass
+        return self.backoff * (2 ** attempt)
+
+    async def arequest(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                       retry_statuses=HTTP_RETRY_STATUSES, **kwargs) -> httpx.Response:
+        connect, read = HTTP_TIMEOUTS[endpoint]
+        kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect))
+        for attempt in range(self.retries + 1):
+            self._count(endpoint)
+            try:
+                r = await client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                self._count(endpoint, "errors")
+                raise
+            if r.status_code not in retry_statuses or attempt == self.retries:
+                return r
+            self._count(endpoint, "retries")
+            await asyncio.sleep(self._retry_delay(r, attempt))
+        return r
+
+    # ---- OpenAI ----
+    def openai(self, api_key: str):
+        with self._lock:
+            client = self._openai.get(api_key)
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(api_key=api_key, timeout=float(HTTP_TIMEOUTS["openai"][1]), max_retries=2)
+                self._openai[api_key] = client
+        self._count("openai")
+        return client
+
+    def metrics(self) -> dict:
+        pools = {}
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{key.key_scheme}://{key.key_host}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool else 0,
+            }
+        with self._lock:
+            counts = {k: dict(v) for k, v in self._counts.items()}
+            openai_clients = len(self._openai)
+        return {"endpoints": counts, "pools": pools, "openai_clients": openai_clients}
+
+
+@st.cache_resource
+def get_http() -> HttpLayer:
+    return HttpLayer()
+
+
+# -----------------------------
+# 중복 요청 병합 (single-flight)
+# -----------------------------
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 호출은 첫 호출(leader) 하나만 실제로 실행하고,
+    나머지는 그 결과(또는 예외)를 그대로 공유한다. 더블클릭/동일 입력 동시 요청 대비.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+        self.calls = 0
+        self.upstream = 0
+
+    def join(self, key: str) -> tuple[Future, bool]:
+        """
+        (future, leader 여부) 반환. leader는 작업이 끝나면 반드시 resolve()를 호출해야 하고,
+        나머지는 future.result()로 결과를 기다린다. (스트리밍처럼 do()로 감쌀 수 없는 경우용)
+        """
+        with self._lock:
+            self.calls += 1
+            fut = self._calls.get(key)
+            if fut is not None:
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self.upstream += 1
+            return fut, True
+
+    def resolve(self, key: str, fut: Future, result=None, error: BaseException | None = None):
+        with self._lock:
+            if self._calls.get(key) is fut:
+                self._calls.pop(key, None)
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def do(self, key: str, fn, *args, **kwargs):
+        fut, leader = self.join(key)
+        if not leader:
+            return fut.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.resolve(key, fut, error=e)
+            raise
+        self.resolve(key, fut, result=result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "upstream": self.upstream,
+                    "saved": self.calls - self.upstream, "in_flight": len(self._calls)}
+
+
+@st.cache_resource
+def get_singleflight(name: str) -> SingleFlight:
+    # 이름별 프로세스 공용 인스턴스
+    return SingleFlight()
+
+
 # -----------------------------
 # LLM 프롬프트/폴백
 # -----------------------------
@@ -466,12 +1484,18 @@ def fallback_lyrics(mbti, keywords, personal_line, joy, energy):
     return "\n".join(lines)
 
 def call_openai(prompt: str):
+    # 같은 프롬프트로 동시에 들어온 요청은 OpenAI 호출 1번으로 병합
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return get_singleflight("openai").do(key, _call_openai_upstream, prompt)
+
+
+def _call_openai_upstream(prompt: str):
     if not OPENAI_AVAILABLE:
         raise RuntimeError("OpenAI SDK not available")
     api_key = get_openai_api_key()
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY not set (secrets 또는 env)")
-    client = OpenAI(api_key=api_key)
+    client = get_http().openai(api_key)
     resp = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": prompt}],
@@ -481,6 +1505,373 @@ def call_openai(prompt: str):
     return resp.choices[0].message.content.strip()
 
 
+class LyricsMetrics:
+    """스트리밍 가사 생성 지표: 첫 토큰까지 시간(TTFT), 초당 토큰 수"""
+
+    def __init__(self, window: int = 500):
+        self._items = deque(maxlen=window)
+        self._clicks = deque(maxlen=window)  # 버튼 클릭 → 가사 표시까지(초)
+        self._events: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_click(self, seconds: float):
+        with self._lock:
+            self._clicks.append(seconds)
+
+    def count(self, event: str):
+        with self._lock:
+            self._events[event] = self._events.get(event, 0) + 1
+
+    def record(self, ttft: float | None, total: float, tokens: int):
+        gen_time = total - (ttft or 0.0)
+        with self._lock:
+            self._items.append({
+                "ttft": ttft,
+                "total": total,
+                "tokens": tokens,
+                "tps": tokens / gen_time if gen_time > 0 else None,
+            })
+
+    def summary(self) -> dict:
+        with self._lock:
+            items = list(self._items)
+            clicks = sorted(self._clicks)
+            events = dict(self._events)
+        ttfts = sorted(i["ttft"] for i in items if i["ttft"] is not None)
+        tps = [i["tps"] for i in items if i["tps"]]
+        return {
+            "requests": len(items),
+            "ttft_p50": round(ttfts[len(ttfts) // 2], 2) if ttfts else None,
+            "ttft_p90": round(ttfts[int(len(ttfts) * 0.9)], 2) if ttfts else None,
+            "tokens_per_sec": round(sum(tps) / len(tps), 1) if tps else None,
+            "click_p99": round(clicks[min(len(clicks) - 1, int(len(clicks) * 0.99))], 2) if clicks else None,
+            "events": events,
+            "last": items[-1] if items else None,
+        }
+
+
+@st.cache_resource
+def get_lyrics_metrics() -> LyricsMetrics:
+    return LyricsMetrics()
+
+
+def _stream_chat(prompt: str, http: HttpLayer, flight: SingleFlight, metrics: LyricsMetrics):
+    """
+    call_openai의 스트리밍 버전: 토큰이 도착하는 대로 텍스트 조각을 yield.
+    TTFT/초당 토큰 수는 metrics에 기록.
+    같은 프롬프트가 이미 생성 중이면 그 결과를 한 번에 받는다(single-flight).
+    의존 객체를 인자로 받아 백그라운드 스레드(LyricsService)에서도 그대로 사용.
+    """
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    fut, leader = flight.join(key)
+    if not leader:
+        yield fut.result()
+        return
+
+    parts = []
+    try:
+        if not OPENAI_AVAILABLE:
+            raise RuntimeError("OpenAI SDK not available")
+        api_key = get_openai_api_key()
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not set (secrets 또는 env)")
+        client = http.openai(api_key)
+        t0 = time.perf_counter()
+        ttft, tokens = None, None
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.8,
+            top_p=0.9,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            parts.append(delta)
+            yield delta
+        metrics.record(ttft, time.perf_counter() - t0, tokens or len(parts))
+    except BaseException as e:
+        flight.resolve(key, fut, error=e)
+        raise
+    flight.resolve(key, fut, result="".join(parts).strip())
+
+
+# 가사 버튼 응답 시간 예산(초): 넘기면 템플릿 가사를 먼저 보여주고 AI 가사는 도착하면 교체
+LYRICS_LATENCY_BUDGET_SEC = float(os.environ.get("LYRICS_LATENCY_BUDGET_SEC", 8.0))
+
+
+class LyricsService:
+    """
+    OpenAI 가사 생성을 백그라운드 스레드에서 돌리고, UI는 예산(budget) 안에서만 기다린다.
+    - start(): 스트리밍 생성 시작 → job_id
+    - iter_until(): 마감 시각까지 도착한 텍스트 조각을 yield (st.write_stream용)
+    - get(): 완료/에러/현재까지의 텍스트 스냅샷 (예산 초과 후 업그레이드 확인용)
+    """
+
+    def __init__(self, http: HttpLayer, flight: SingleFlight, metrics: LyricsMetrics,
+                 budget: float = LYRICS_LATENCY_BUDGET_SEC, workers: int = 8, max_jobs: int = 500):
+        self.http = http
+        self.flight = flight
+        self.metrics = metrics
+        self.budget = budget
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lyrics")
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._cond = threading.Condition()
+
+    def start(self, prompt: str, on_done=None) -> str:
+        """
+        on_done(text): 생성이 끝나면 워커 스레드에서 항상 호출 (캐시 적재/채우는 중 표시 해제용).
+        실패하거나 빈 응답이면 text=None.
+        """
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            self._jobs[job_id] = {"text": "", "done": False, "error": None, "started": time.time()}
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job_id, prompt, on_done)
+        return job_id
+
+    def _run(self, job_id: str, prompt: str, on_done=None):
+        text = None
+        try:
+            for delta in _stream_chat(prompt, self.http, self.flight, self.metrics):
+                with self._cond:
+                    self._jobs[job_id]["text"] += delta
+                    self._cond.notify_all()
+            with self._cond:
+                job = self._jobs[job_id]
+                job["text"] = job["text"].strip()
+                job["done"] = True
+                text = job["text"] or None
+                self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                if job_id in self._jobs:
+                    self._jobs[job_id].update(done=True, error=str(e))
+                self._cond.notify_all()
+        finally:
+            if on_done is not None:
+                on_done(text)
+
+    def get(self, job_id: str | None) -> dict | None:
+        with self._cond:
+            job = self._jobs.get(job_id) if job_id else None
+            return dict(job) if job else None
+
+    def iter_until(self, job_id: str, deadline: float):
+        sent = 0
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                while len(job["text"]) == sent and not job["done"] and time.time() < deadline:
+                    self._cond.wait(timeout=max(0.0, deadline - time.time()))
+                chunk = job["text"][sent:]
+                sent = len(job["text"])
+                finished = job["done"]
+            if chunk:
+                yield chunk
+            if finished or time.time() >= deadline:
+                return
+
+
+@st.cache_resource
+def get_lyrics_service() -> LyricsService:
+    return LyricsService(get_http(), get_singleflight("openai"), get_lyrics_metrics())
+
+
+LYRICS_CACHE_DB = os.environ.get("LYRICS_CACHE_DB", "lyrics_cache.sqlite3")
+LYRICS_BUCKET_STEP = int(os.environ.get("LYRICS_BUCKET_STEP", 20))       # joy/energy 버킷 간격(%)
+LYRICS_CACHE_VARIANTS = int(os.environ.get("LYRICS_CACHE_VARIANTS", 3))  # 키당 보관할 가사 수
+LYRICS_WARMUP_TOP_N = int(os.environ.get("LYRICS_WARMUP_TOP_N", 0))      # 0이면 워밍업 안 함
+
+
+def _bucket(value: int, step: int = LYRICS_BUCKET_STEP) -> int:
+    """0~100 값을 step 간격 구간의 중앙값으로 (예: step 20 → 67 → 70)"""
+    step = max(1, step)
+    return min(100, (int(value) // step) * step + step // 2)
+
+
+def lyrics_cache_key(mbti: str, keywords, personal_line: str, joy: int, energy: int) -> str:
+    """키워드 정렬, joy/energy 버킷, 빈 메모는 '없음'으로 정규화한 캐시 키"""
+    norm = {
+        "mbti": mbti,
+        "keywords": sorted({k.strip() for k in (keywords or []) if k.strip()}),
+        "memo": (personal_line or "").strip() or "없음",
+        "joy": _bucket(joy),
+        "energy": _bucket(energy),
+    }
+    return json.dumps(norm, ensure_ascii=False, sort_keys=True)
+
+
+class LyricsCache:
+    """
+    정규화된 입력 → LLM 가사 여러 개(variant). temperature 0.8이라 다양성을 살리려고
+    키마다 최대 `variants`개를 모아 두고 요청마다 돌려가며 내준다.
+    SQLite에 저장하므로 워밍업 작업이 미리 채워 둘 수 있다.
+    """
+
+    def __init__(self, path: str = LYRICS_CACHE_DB, variants: int = LYRICS_CACHE_VARIANTS):
+        self.variants = variants
+        self._lock = threading.Lock()
+        self._rotation: dict[str, int] = {}
+        self._filling: set[str] = set()  # 백그라운드 생성 중인 키
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS lyrics_cache (
+                    cache_key  TEXT,
+                    variant    INTEGER,
+                    lyrics     TEXT,
+                    created_at REAL,
+                    PRIMARY KEY (cache_key, variant)
+                )
+            """)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM lyrics_cache WHERE cache_key = ?", (key,)
+            ).fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        """다음 순서의 variant (없으면 None)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lyrics FROM lyrics_cache WHERE cache_key = ? ORDER BY variant", (key,)
+            ).fetchall()
+            if not rows:
+                self.misses += 1
+                return None
+            i = self._rotation.get(key, 0)
+            self._rotation[key] = i + 1
+            self.hits += 1
+            return rows[i % len(rows)][0]
+
+    def add(self, key: str, lyrics: str):
+        """variant 추가 (꽉 찼으면 가장 오래된 것을 교체, 같은 가사는 무시)"""
+        lyrics = (lyrics or "").strip()
+        if not lyrics:
+            return
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT variant, lyrics, created_at FROM lyrics_cache WHERE cache_key = ?", (key,)
+            ).fetchall()
+            if any(r[1] == lyrics for r in rows):
+                return
+            if len(rows) < self.variants:
+                variant = len(rows)
+            else:
+                variant = min(rows, key=lambda r: r[2])[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lyrics_cache (cache_key, variant, lyrics, created_at) VALUES (?, ?, ?, ?)",
+                (key, variant, lyrics, time.time()),
+            )
+
+    def needs_fill(self, key: str) -> bool:
+        """variant가 부족하고 아직 채우는 중이 아니면 True (그리고 '채우는 중'으로 표시)"""
+        if self.count(key) >= self.variants:
+            return False
+        with self._lock:
+            if key in self._filling:
+                return False
+            self._filling.add(key)
+            return True
+
+    def fill_done(self, key: str, lyrics: str | None = None):
+        if lyrics:
+            self.add(key, lyrics)
+        with self._lock:
+            self._filling.discard(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = self._conn.execute("SELECT COUNT(DISTINCT cache_key) FROM lyrics_cache").fetchone()[0]
+            return {"keys": keys, "hits": self.hits, "misses": self.misses, "filling": len(self._filling)}
+
+
+@st.cache_resource
+def get_lyrics_cache() -> LyricsCache:
+    return LyricsCache()
+
+
+def warm_lyrics_cache(records: list[dict], top_n: int = 20, cache: LyricsCache | None = None,
+                      generate=None) -> int:
+    """
+    시트 로그에서 가장 많이 나온 (MBTI, 키워드 조합) top_n개를 골라 가사 캐시를 미리 채운다.
+    joy/energy는 해당 조합 기록의 중앙값, 메모는 '없음' 기준. 새로 만든 가사 수를 반환.
+    """
+    cache = cache or get_lyrics_cache()
+    generate = generate or call_openai
+    groups: dict[tuple, list[tuple[int, int]]] = {}
+    for rec in records:
+        mbti = str(rec.get("mbti") or "").strip()
+        if mbti not in MBTI_OPTIONS:
+            continue
+        kws = tuple(sorted({k.strip() for k in str(rec.get("keywords") or "").split(",") if k.strip()}))
+        try:
+            joy, energy = int(float(rec.get("joy"))), int(float(rec.get("energy")))
+        except (TypeError, ValueError):
+            joy, energy = 50, 50
+        groups.setdefault((mbti, kws), []).append((joy, energy))
+
+    made = 0
+    popular = sorted(groups.items(), key=lambda kv: len(kv[1]), reverse=True)[:top_n]
+    for (mbti, kws), values in popular:
+        joy = sorted(v[0] for v in values)[len(values) // 2]
+        energy = sorted(v[1] for v in values)[len(values) // 2]
+        key = lyrics_cache_key(mbti, list(kws), "", joy, energy)
+        prompt = make_prompt(mbti, list(kws), "", _bucket(joy), _bucket(energy))
+        for _ in range(max(0, cache.variants - cache.count(key))):
+            try:
+                cache.add(key, generate(prompt))
+                made += 1
+            except Exception:
+                break
+    return made
+
+
+@st.cache_resource
+def start_lyrics_warmup(top_n: int):
+    """프로세스당 한 번, 요청 경로 밖(백그라운드 스레드)에서 가사 캐시 워밍업"""
+    def run():
+        try:
+            warm_lyrics_cache(conn.get().get_all_records(), top_n=top_n, cache=cache)
+        except Exception as e:
+            conn.report_error(e)
+    cache = get_lyrics_cache()
+    conn = get_sheet_connection()
+    t = threading.Thread(target=run, name="lyrics-warmup", daemon=True)
+    t.start()
+    return t
+
+
+def write_stream(chunks) -> str:
+    """st.write_stream 호환 래퍼 (미지원 버전은 placeholder에 누적 출력)"""
+    if hasattr(st, "write_stream"):
+        out = st.write_stream(chunks)
+        return out if isinstance(out, str) else "".join(map(str, out))
+    box = st.empty()
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        box.markdown(text)
+    return text
+
+
 # -----------------------------
 # suno api 음악 생성
 # -----------------------------
@@ -609,22 +2000,19 @@ def _build_suno_prompt(
 
 
 
-def generate_music_with_suno(lyrics: str, mbti: str, title: str = "", vocal_gender: str = "상관없음") -> dict:
-    """
-    Suno API로 곡 생성 → taskId 폴링 → 재생 가능한 URL 반환.
-    return 예시: {"stream_url": "...", "audio_url": "...", "cover": "..."}
-    """
-    api_key = get_suno_api_key()
-    if not api_key:
-        raise RuntimeError("SUNO_API_KEY 가 설정되어 있지 않습니다. secrets.toml의 [suno].api_key 를 확인하세요.")
+SUNO_API_BASE = "https://api.sunoapi.org/api/v1"
+SUNO_SUCCESS_STATUSES = ("FIRST_SUCCESS", "SUCCESS")
+SUNO_FAILED_STATUSES = ("CREATE_TASK_FAILED", "GENERATE_AUDIO_FAILED", "SENSITIVE_WORD_ERROR")
+
 
-    headers = {"Authorization": f"Bearer {api_key}"}
+def build_suno_payload(lyrics: str, mbti: str, title: str = "", vocal_gender: str = "상관없음") -> dict:
+    """가사/MBTI/보컬 성별 → Suno /generate 요청 payload"""
     prompt, extracted_title = _build_suno_prompt(
         lyrics_text=lyrics,
         mbti=mbti,
         vocal_gender=vocal_gender
     )
-    payload = {
+    return {
         "model": "V4_5", 
         # 최소 파라미터 (문서 기준)
         "prompt": prompt,
@@ -635,70 +2023,1057 @@ def generate_music_with_suno(lyrics: str, mbti: str, title: str = "", vocal_gend
         "customMode": True,
         "instrumental": False,
         "callBackUrl": "https://example.com/callback"  # 더미 URL
+    }
 
 
-    }
+def suno_payload_hash(payload: dict) -> str:
+    """
+    payload 내용 기준 해시 (중복 제출 방지 + 결과 캐시 키).
+    결과에 영향 없는 callBackUrl은 빼고, 줄 끝 공백을 정리한 뒤 정렬된 JSON으로 해시.
+    """
+    norm = {k: v for k, v in payload.items() if k != "callBackUrl"}
+    if isinstance(norm.get("prompt"), str):
+        norm["prompt"] = "\n".join(line.rstrip() for line in norm["prompt"].strip().splitlines())
+    raw = json.dumps(norm, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+AUDIO_STORE_DIR = os.environ.get("AUDIO_STORE_DIR", "audio_cache")
+AUDIO_STORE_MAX_BYTES = int(os.environ.get("AUDIO_STORE_MAX_BYTES", 1024 * 1024 * 1024))
+
+
+class AudioStore:
+    """
+    MP3를 디스크에 내용 주소(sha256) 파일로 저장하는 LRU 저장소.
+    - 다운로드 중 청크 단위로 바로 디스크에 기록 (메모리에 전체 파일을 올리지 않음)
+    - 총 용량(max_bytes) 초과 시 가장 오래 안 쓴 파일부터 삭제
+    - 세션은 key(해시 문자열)만 들고 있고, 다운로드 버튼은 파일에서 읽는다
+    """
+
+    def __init__(self, root: str = AUDIO_STORE_DIR, max_bytes: int = AUDIO_STORE_MAX_BYTES, ext: str = ".mp3"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ext = ext
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size (오래된 것부터)
+        self._bytes = 0
+        os.makedirs(root, exist_ok=True)
+        # 재시작 시 기존 파일을 마지막 사용 시각(mtime) 순으로 복구
+        files = []
+        for name in os.listdir(root):
+            if name.endswith(ext):
+                info = os.stat(os.path.join(root, name))
+                files.append((info.st_mtime, name[: -len(ext)], info.st_size))
+            elif name.endswith(".part"):
+                os.remove(os.path.join(root, name))  # 중단된 다운로드 잔여물
+        for _, key, size in sorted(files):
+            self._index[key] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + self.ext)
+
+    def put_stream(self, chunks, on_progress=None) -> str:
+        """바이트 청크 iterable → 디스크 저장 후 key 반환"""
+        h = hashlib.sha256()
+        tmp = os.path.join(self.root, f"{uuid.uuid4().hex}.part")
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    h.update(chunk)
+                    size += len(chunk)
+                    if on_progress is not None:
+                        on_progress(size)
+            key = h.hexdigest()
+            os.replace(tmp, self._path(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            if key in self._index:
+                self._bytes -= self._index.pop(key)
+            self._index[key] = size
+            self._bytes += size
+            self._evict()
+        return key
+
+    def put_bytes(self, data: bytes) -> str:
+        return self.put_stream([data])
+
+    def path(self, key: str | None) -> str | None:
+        """파일 경로 (없으면 None). 조회도 '사용'으로 보고 LRU 순서를 갱신"""
+        if not key:
+            return None
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._bytes -= self._index.pop(key, 0)
+            return None
+        return path
+
+    def read(self, key: str) -> bytes:
+        """파일 내용 (다운로드 버튼의 지연 data용: 클릭했을 때만 디스크에서 읽음)"""
+        path = self.path(key)
+        if path is None:
+            raise FileNotFoundError(f"오디오 파일이 저장소에서 지워졌습니다: {key}")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def size(self, key: str | None) -> int:
+        with self._lock:
+            return self._index.get(key, 0) if key else 0
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            old_key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+@st.cache_resource
+def get_audio_store() -> AudioStore:
+    return AudioStore()
+
+
+class AudioPrefetcher:
+    """
+    audioUrl이 나오자마자 백그라운드 스레드 풀에서 MP3를 미리 받아 AudioStore에 저장.
+    UI는 get()으로 진행 상태(받은 바이트/전체 크기)만 읽는다.
+    실패해도 자동으로 재시도하지 않음 → 사용자가 '다시 받기'를 눌렀을 때만 재시도.
+    """
+
+    def __init__(self, store: AudioStore, http: HttpLayer, result_cache=None,
+                 workers: int = 4, chunk_size: int = 64 * 1024, max_states: int = 1000):
+        self.store = store
+        self.http = http
+        self.result_cache = result_cache
+        self.chunk_size = chunk_size
+        self.max_states = max_states
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-prefetch")
+        self._states: "OrderedDict[str, dict]" = OrderedDict()  # url -> 상태
+        self._lock = threading.Lock()
+
+    def start(self, url: str, cache_key: str | None = None, force: bool = False) -> dict:
+        with self._lock:
+            state = self._live_state(url)
+            if state and not (force and state["status"] == "error"):
+                return dict(state)
+            state = {"url": url, "status": "queued", "bytes": 0, "total": None,
+                     "audio_key": None, "error": None, "updated_at": time.time()}
+            self._states[url] = state
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+        self._pool.submit(self._fetch, url, cache_key)
+        return dict(state)
+
+    def get(self, url: str | None) -> dict | None:
+        with self._lock:
+            state = self._live_state(url) if url else None
+            return dict(state) if state else None
+
+    def _live_state(self, url: str) -> dict | None:
+        """
+        url의 상태 (self._lock 안에서 호출).
+        받아 둔 파일이 AudioStore에서 지워졌으면 상태도 버림 → 없는 것으로 보고 start()가 다시 받는다
+        """
+        state = self._states.get(url)
+        if state and state["status"] == "done" and self.store.path(state["audio_key"]) is None:
+            del self._states[url]
+            return None
+        return state
+
+    def _set(self, url: str, **fields):
+        with self._lock:
+            if url in self._states:
+                self._states[url].update(fields, updated_at=time.time())
+
+    def _fetch(self, url: str, cache_key: str | None):
+        try:
+            self._set(url, status="downloading")
+            with self.http.get("audio", url, stream=True) as r:
+                r.raise_for_status()
+                total = r.headers.get("Content-Length")
+                self._set(url, total=int(total) if total and total.isdigit() else None)
+                audio_key = self.store.put_stream(
+                    r.iter_content(chunk_size=self.chunk_size),
+                    on_progress=lambda n: self._set(url, bytes=n),
+                )
+            if self.result_cache is not None and cache_key:
+                self.result_cache.attach_audio(cache_key, audio_key)
+            self._set(url, status="done", audio_key=audio_key)
+        except Exception as e:
+            self._set(url, status="error", error=str(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for state in self._states.values():
+                counts[state["status"]] = counts.get(state["status"], 0) + 1
+            return counts
+
+
+@st.cache_resource
+def get_audio_prefetcher() -> AudioPrefetcher:
+    return AudioPrefetcher(get_audio_store(), get_http(), result_cache=get_suno_cache())
+
+
+# Suno 결과 URL 유지 기간(초). 생성 파일은 약 15일 보관되므로 여유를 두고 14일.
+SUNO_RESULT_TTL_SEC = int(os.environ.get("SUNO_RESULT_TTL_SEC", 14 * 24 * 3600))
+SUNO_RESULT_CACHE_ENTRIES = int(os.environ.get("SUNO_RESULT_CACHE_ENTRIES", 2000))
+SUNO_JOB_DB = os.environ.get("SUNO_JOB_DB", "suno_jobs.sqlite3")
+
+
+class SunoResultCache:
+    """
+    payload 해시 → 생성 결과(stream/audio/cover URL + 저장된 MP3의 AudioStore key) 캐시.
+    같은 입력으로 다시 생성하면 Suno를 다시 부르지 않고 즉시 재생.
+    - TTL: Suno URL 만료 기준
+    - 항목 수 기준 LRU 제거 (MP3 용량은 AudioStore가 관리)
+    - suno_results 테이블(SunoJobStore와 같은 DB)에 함께 기록 → 재시작 후에도 디스크의 MP3를 다시 찾는다
+    """
+
+    def __init__(self, path: str = SUNO_JOB_DB, ttl: float = SUNO_RESULT_TTL_SEC,
+                 max_entries: int = SUNO_RESULT_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS suno_results (
+                    payload_hash TEXT PRIMARY KEY,
+                    stream_url   TEXT,
+                    audio_url    TEXT,
+                    cover        TEXT,
+                    audio_key    TEXT,
+                    created_at   REAL
+                )
+            """)
+            self._conn.execute("DELETE FROM suno_results WHERE created_at < ?", (time.time() - ttl,))
+            rows = self._conn.execute(
+                "SELECT payload_hash, stream_url, audio_url, cover, audio_key, created_at "
+                "FROM suno_results ORDER BY created_at DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+        for key, stream_url, audio_url, cover, audio_key, created_at in reversed(rows):
+            self._items[key] = {"stream_url": stream_url, "audio_url": audio_url, "cover": cover,
+                                "audio_key": audio_key, "created_at": created_at}
+
+    def _save(self, key: str, item: dict):
+        # self._lock 안에서 호출
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO suno_results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, item["stream_url"], item["audio_url"], item["cover"], item["audio_key"], item["created_at"]),
+            )
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item and time.time() - item["created_at"] > self.ttl:
+                self._items.pop(key, None)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return dict(item)
+
+    def peek(self, key: str) -> bool:
+        """적중 여부만 확인 (통계/LRU 순서에 영향 없음)"""
+        with self._lock:
+            item = self._items.get(key)
+            return bool(item) and time.time() - item["created_at"] <= self.ttl
+
+    def put(self, key: str, stream_url: str | None, audio_url: str | None, cover: str | None):
+        with self._lock:
+            old = self._items.get(key) or {}
+            if old.get("audio_url") == audio_url and old.get("stream_url") == stream_url:
+                return
+            item = {
+                "stream_url": stream_url, "audio_url": audio_url, "cover": cover,
+                "audio_key": None, "created_at": time.time(),
+            }
+            self._items[key] = item
+            self._items.move_to_end(key)
+            self._save(key, item)
+            while len(self._items) > self.max_entries:
+                old_key, _ = self._items.popitem(last=False)
+                with self._conn:
+                    self._conn.execute("DELETE FROM suno_results WHERE payload_hash = ?", (old_key,))
+
+    def attach_audio(self, key: str, audio_key: str):
+        """다운로드해 둔 MP3(AudioStore key) 연결"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                item["audio_key"] = audio_key
+                self._save(key, item)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_suno_cache() -> SunoResultCache:
+    return SunoResultCache(SUNO_JOB_DB)
+
+
+# 시간 초과된 작업도 Suno가 결과를 보관하는 동안(기본 15일)은 계속 재확인한다
+SUNO_RETENTION_SEC = float(os.environ.get("SUNO_RETENTION_SEC", 15 * 24 * 3600))
+SUNO_RECHECK_MIN_SEC = 60.0      # 재확인 간격 하한
+SUNO_RECHECK_MAX_SEC = 6 * 3600  # 재확인 간격 상한 (작업이 오래될수록 간격이 늘어남)
+
+SUNO_JOB_COLUMNS = [
+    "job_id", "task_id", "session_id", "payload_hash", "status", "done",
+    "stream_url", "audio_url", "cover", "error", "polls", "meta", "created_at", "updated_at",
+    "stream_at", "mp3_at",
+]
 
-    # 1) 생성 요청
-    r = requests.post("https://api.sunoapi.org/api/v1/generate", headers=headers, json=payload, timeout=30)
-    r.raise_for_status()
-    j = r.json()
-    if j.get("code") != 200 or "data" not in j or "taskId" not in j["data"]:
-        raise RuntimeError(f"Suno generate 응답 비정상: {j}")
-    task_id = j["data"]["taskId"]
-
-    # 2) 상태 폴링 (스트리밍 URL이 보통 더 빨리 준비됨)
-    stream_url, audio_url, cover = None, None, None
-    for _ in range(70):  # 최대 약 2분 폴링(2s * 60)
-        time.sleep(2)
-        q = requests.get(
-            "https://api.sunoapi.org/api/v1/generate/record-info",
-            headers=headers,
-            params={"taskId": task_id},
-            timeout=20
+
+class SunoJobStore:
+    """
+    Suno 작업 테이블 (SQLite). 프로세스가 재시작돼도 taskId가 남아서
+    폴링을 이어가거나 세션이 job_id로 다시 붙을 수 있게 한다.
+    """
+
+    def __init__(self, path: str = SUNO_JOB_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS suno_jobs (
+                    job_id       TEXT PRIMARY KEY,
+                    task_id      TEXT,
+                    session_id   TEXT,
+                    payload_hash TEXT,
+                    status       TEXT,
+                    done         INTEGER DEFAULT 0,
+                    stream_url   TEXT,
+                    audio_url    TEXT,
+                    cover        TEXT,
+                    error        TEXT,
+                    polls        INTEGER DEFAULT 0,
+                    meta         TEXT,
+                    created_at   REAL,
+                    updated_at   REAL,
+                    stream_at    REAL,
+                    mp3_at       REAL
+                )
+            """)
+            # 이전 버전 테이블 보정 (컬럼 추가)
+            existing = {r["name"] for r in self._conn.execute("PRAGMA table_info(suno_jobs)")}
+            for col in ("stream_at", "mp3_at"):
+                if col not in existing:
+                    self._conn.execute(f"ALTER TABLE suno_jobs ADD COLUMN {col} REAL")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_suno_jobs_session ON suno_jobs(session_id, payload_hash)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_suno_jobs_open ON suno_jobs(done, status)")
+
+    @staticmethod
+    def _to_job(row) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        job["done"] = bool(job["done"])
+        return job
+
+    def upsert(self, job: dict):
+        values = [job.get(c) for c in SUNO_JOB_COLUMNS]
+        values[SUNO_JOB_COLUMNS.index("done")] = int(bool(job.get("done")))
+        placeholders = ",".join("?" for _ in SUNO_JOB_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO suno_jobs ({','.join(SUNO_JOB_COLUMNS)}) VALUES ({placeholders})",
+                values,
+            )
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM suno_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def find_reusable(self, session_id: str, payload_hash: str) -> dict | None:
+        """같은 세션+같은 payload로 진행 중이거나 성공한(또는 taskId가 남은) 작업"""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT * FROM suno_jobs
+                WHERE session_id = ? AND payload_hash = ?
+                  AND (done = 0 OR error IS NULL OR (status = 'TIMEOUT' AND task_id IS NOT NULL))
+                ORDER BY created_at DESC LIMIT 1
+                """,
+                (session_id, payload_hash),
+            ).fetchone()
+        return self._to_job(row)
+
+    def pending(self, retention: float = SUNO_RETENTION_SEC) -> list[dict]:
+        """미완료 작업 + 보관 기간 안의 시간 초과 작업(taskId 있음) → reconciler가 계속 확인"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT * FROM suno_jobs
+                WHERE done = 0
+                   OR (done = 1 AND status = 'TIMEOUT' AND task_id IS NOT NULL AND created_at > ?)
+                """,
+                (time.time() - retention,),
+            ).fetchall()
+        return [self._to_job(r) for r in rows]
+
+    def latency_samples(self, limit: int = 200) -> tuple[list[float], list[float]]:
+        """최근 완료 작업의 (제출→스트리밍, 스트리밍→MP3) 소요 시간(초)"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT stream_at - created_at AS to_stream, mp3_at - stream_at AS to_mp3
+                FROM suno_jobs WHERE stream_at IS NOT NULL
+                ORDER BY updated_at DESC LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        to_stream = [r["to_stream"] for r in rows if r["to_stream"] and r["to_stream"] > 0]
+        to_mp3 = [r["to_mp3"] for r in rows if r["to_mp3"] and r["to_mp3"] > 0]
+        return to_stream, to_mp3
+
+
+class AsyncRateLimiter:
+    """전체 record-info 요청 수 상한 (토큰 버킷, 이벤트 루프 안에서만 사용)"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = None  # asyncio.Lock (루프 안에서 생성)
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PollScheduler:
+    """
+    record-info 폴링 간격 계산.
+    - 완료된 작업에서 관측한 (제출→스트리밍), (스트리밍→MP3) 소요 시간 분포를 학습
+    - 가장 이른 완료 예상 시점(p10) 전에는 폴링하지 않고 기다림
+    - 그 이후엔 지수 백오프 + 지터, 단 중앙값(p50)을 크게 지나치지 않도록 상한
+    """
+
+    # 관측치가 없을 때 쓰는 기본 분포(초)
+    PRIOR_TO_STREAM = [30.0, 40.0, 50.0, 60.0, 75.0, 90.0]
+    PRIOR_TO_MP3 = [20.0, 30.0, 45.0, 60.0, 90.0]
+
+    def __init__(self, base: float = 1.5, factor: float = 1.6, max_delay: float = 10.0,
+                 jitter: float = 0.2, window: int = 200):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._to_stream = deque(maxlen=window)
+        self._to_mp3 = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def seed(self, to_stream: list[float], to_mp3: list[float]):
+        with self._lock:
+            self._to_stream.extend(to_stream)
+            self._to_mp3.extend(to_mp3)
+
+    def observe(self, phase: str, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            (self._to_stream if phase == "stream" else self._to_mp3).append(seconds)
+
+    def _samples(self, phase: str) -> list[float]:
+        with self._lock:
+            data = list(self._to_stream if phase == "stream" else self._to_mp3)
+        if len(data) < 5:
+            data += self.PRIOR_TO_STREAM if phase == "stream" else self.PRIOR_TO_MP3
+        return sorted(data)
+
+    def quantile(self, phase: str, q: float) -> float:
+        data = self._samples(phase)
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+    def next_delay(self, phase: str, elapsed: float, attempt: int) -> float:
+        """
+        phase: "stream"(스트리밍 대기) / "mp3"(MP3 대기)
+        elapsed: 해당 단계 시작 후 경과 시간, attempt: 단계 내 폴링 횟수
+        """
+        earliest = self.quantile(phase, 0.1)
+        median = self.quantile(phase, 0.5)
+        if elapsed < earliest:
+            delay = earliest - elapsed
+        else:
+            delay = self.base * (self.factor ** attempt)
+            if elapsed < median:
+                # 중앙값 근처에서는 촘촘하게
+                delay = min(delay, max(self.base, (median - elapsed) / 2))
+            delay = min(delay, self.max_delay)
+        # 여러 사용자가 같은 박자로 때리지 않도록 지터
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.5, delay)
+
+    def stats(self) -> dict:
+        return {
+            "to_stream_p50": round(self.quantile("stream", 0.5), 1),
+            "to_stream_p90": round(self.quantile("stream", 0.9), 1),
+            "to_mp3_p50": round(self.quantile("mp3", 0.5), 1),
+            "samples": len(self._to_stream),
+        }
+
+
+class SunoJobEngine:
+    """
+    Suno 생성 작업을 공유 asyncio 이벤트 루프(백그라운드 스레드 1개)에서 처리.
+    - submit(): 작업 등록 후 바로 job_id 반환 (Streamlit 스크립트 스레드는 블로킹 없음)
+    - get(): 작업 상태 스냅샷 → UI는 이것만 읽는다
+    - 모든 상태 변화는 SunoJobStore에 기록되고, reconciler가 주기적으로
+      미완료 taskId를 다시 폴링한다 (재시작/타임아웃 후에도 결과를 버리지 않음).
+    사용자별 스레드 없이 수백 개 taskId를 동시에 폴링할 수 있음.
+    """
+
+    def __init__(self, store: SunoJobStore, http: HttpLayer, result_cache: SunoResultCache | None = None,
+                 on_audio_ready=None, api_key_fn=None, scheduler: PollScheduler | None = None,
+                 stream_timeout: float = 140.0, mp3_timeout: float = 180.0, max_rps: float = 5.0,
+                 workers: int = 8, reconcile_every: float = 15.0):
+        self.store = store
+        self.http = http
+        self.result_cache = result_cache
+        self.on_audio_ready = on_audio_ready  # (audio_url, payload_hash) → MP3 프리패치 시작
+        self.api_key_fn = api_key_fn or get_suno_api_key
+        self.scheduler = scheduler or PollScheduler()
+        self.scheduler.seed(*store.latency_samples())
+        self.stream_timeout = stream_timeout  # 스트리밍 URL까지 최대 대기(초)
+        self.mp3_timeout = mp3_timeout        # 스트리밍 이후 MP3(audioUrl)까지 추가 대기(초)
+        self._limiter = AsyncRateLimiter(max_rps)  # 프로세스 전체 record-info 초당 요청 상한
+        self.reconcile_every = reconcile_every
+        self._workers = workers
+        self._jobs: dict[str, dict] = {}  # 진행 중인 작업만 (끝난 작업은 store에서 읽음)
+        self._futures = {}
+        self._running: set[str] = set()  # 루프에서 처리 중인 job_id
+        self._rechecking: set[str] = set()  # 시간 초과 후 재확인 중인 job_id
+        self.recovered = 0  # 시간 초과 후 재확인으로 되찾은 곡 수
+        self._finished = deque(maxlen=200)  # 최근 완료 작업의 (폴링 수, 제출→재생 초) — 지표용
+        self.coalesced = 0  # 진행 중 작업에 합류시켜 아낀 생성 요청 수
+        self._lock = threading.Lock()
+        self._client = None  # httpx.AsyncClient (루프 스레드 안에서 생성)
+        self._slots = None   # asyncio.Semaphore: 동시 record-info 요청 수 (워커 풀 크기)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="suno-engine", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._reconcile_forever(), self._loop)
+
+    # ---- UI 스레드에서 호출 ----
+    def submit(self, api_key: str, payload: dict, session_id: str = "", meta: dict | None = None) -> str:
+        payload_hash = suno_payload_hash(payload)
+        speculative = bool((meta or {}).get("speculative"))
+        existing = self.store.find_reusable(session_id, payload_hash) if session_id else None
+        if existing:
+            # 같은 요청은 다시 제출하지 않고 기존 작업에 붙는다
+            if existing["done"] and existing["error"]:
+                self.resume(existing["job_id"])
+            if not speculative:
+                self.claim(existing["job_id"])
+            return existing["job_id"]
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "job_id": job_id, "task_id": None, "session_id": session_id,
+            "payload_hash": payload_hash, "status": "QUEUED", "done": False,
+            "stream_url": None, "audio_url": None, "cover": None, "error": None,
+            "polls": 0, "meta": json.dumps(meta or {}, ensure_ascii=False),
+            "created_at": now, "updated_at": now,
+        }
+        with self._lock:
+            # 다른 세션이 같은 payload로 진행 중이면 그 작업을 공유 (single-flight)
+            shared = None
+            for other_id in self._running:
+                other = self._jobs.get(other_id)
+                if other and other["payload_hash"] == payload_hash and not other["error"]:
+                    shared = other_id
+                    self.coalesced += 1
+                    break
+            else:
+                self._running.add(job_id)  # reconciler가 제출 중인 작업을 건드리지 않도록 먼저 표시
+                self._jobs[job_id] = job
+        if shared is not None:
+            if not speculative:
+                self.claim(shared)
+            return shared
+        self.store.upsert(job)
+        with self._lock:
+            self._futures[job_id] = asyncio.run_coroutine_threadsafe(
+                self._run_job(job_id, api_key, payload), self._loop
+            )
+        return job_id
+
+    def claim(self, job_id: str):
+        """
+        추측 실행 작업을 실제 요청이 이어받음 → 이후 MP3가 도착하면 프리패치한다.
+        (이어받기 전의 추측 작업은 버려질 수 있어서 MP3를 미리 받지 않음)
+        """
+        job = self.get(job_id)
+        if not job:
+            return
+        meta = json.loads(job.get("meta") or "{}")
+        if not meta.pop("speculative", False):
+            return
+        meta = json.dumps(meta, ensure_ascii=False)
+        with self._lock:
+            in_memory = job_id in self._jobs
+        if in_memory:
+            self._update(job_id, meta=meta)
+        else:
+            # 이미 끝나 메모리에서 내려간 작업 → 기록만 고침
+            self.store.upsert(dict(job, meta=meta, updated_at=time.time()))
+        if job.get("audio_url"):
+            # 이어받기 전에 MP3가 이미 도착했으면 건너뛴 프리패치를 지금 시작
+            self._audio_ready(job_id, job["audio_url"], job["payload_hash"])
+
+    def resume(self, job_id: str) -> bool:
+        """taskId가 있는 작업의 폴링을 (다시) 시작. 상태 새로고침 버튼/재시작 복구용"""
+        job = self.get(job_id)
+        if not job or not job["task_id"]:
+            return False
+        with self._lock:
+            if job_id in self._running:
+                return True
+            self._running.add(job_id)
+            self._jobs.setdefault(job_id, job)  # 끝난 작업은 메모리에 없으므로 다시 올림
+        self._update(job_id, status="PENDING", done=False, error=None)
+        fut = asyncio.run_coroutine_threadsafe(
+            self._resume_job(job_id, job["task_id"]), self._loop
         )
+        with self._lock:
+            self._futures[job_id] = fut
+        return True
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        job = self.store.get(job_id)
+        if job and not job["done"]:
+            with self._lock:
+                self._jobs.setdefault(job_id, job)
+        return dict(job) if job else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = len(self._jobs)
+            in_flight = len(self._running)
+            finished = list(self._finished)
+        polls = [p for p, _ in finished]
+        to_play = sorted(t for _, t in finished if t is not None)
+        return {
+            "jobs": jobs,
+            "in_flight": in_flight,
+            "coalesced": self.coalesced,
+            "recovered": self.recovered,
+            "polls_per_song": round(sum(polls) / len(polls), 1) if polls else None,
+            "p50_time_to_play": round(to_play[len(to_play) // 2], 1) if to_play else None,
+            **self.scheduler.stats(),
+        }
+
+    # ---- 루프 스레드 내부 ----
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated_at=time.time())
+            snapshot = dict(job)
+            if job["done"] and job_id not in self._running:
+                self._forget(job_id)
+        self.store.upsert(snapshot)
+
+    def _forget(self, job_id: str):
+        """끝난 작업을 메모리에서 내림 (self._lock 안에서 호출, 기록은 store에 남아 있음)"""
+        job = self._jobs.pop(job_id, None)
+        self._futures.pop(job_id, None)
+        if job and job.get("mp3_at"):
+            to_play = job["stream_at"] - job["created_at"] if job.get("stream_at") else None
+            self._finished.append((job.get("polls") or 0, to_play))
+
+    def _audio_ready(self, job_id: str, audio_url: str, payload_hash: str | None):
+        """MP3 도착 → 프리패치 시작 (아직 아무도 이어받지 않은 추측 실행 작업은 건너뜀)"""
+        if self.on_audio_ready is None:
+            return
+        job = self.get(job_id) or {}
+        if json.loads(job.get("meta") or "{}").get("speculative"):
+            return
+        self.on_audio_ready(audio_url, payload_hash)
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self.http.async_client(SUNO_API_BASE)
+        return self._client
+
+    async def _guard(self, job_id: str, coro):
+        try:
+            await coro
+        except TimeoutError as e:
+            self._update(job_id, status="TIMEOUT", error=str(e), done=True)
+        except Exception as e:
+            self._update(job_id, status="ERROR", error=str(e), done=True)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                job = self._jobs.get(job_id)
+                if job and job["done"]:
+                    self._forget(job_id)
+
+    async def _run_job(self, job_id: str, api_key: str, payload: dict):
+        await self._guard(job_id, self._generate_and_poll(job_id, api_key, payload))
+
+    async def _resume_job(self, job_id: str, task_id: str):
+        await self._guard(job_id, self._poll(job_id, task_id, self.api_key_fn()))
+
+    async def _generate_and_poll(self, job_id: str, api_key: str, payload: dict):
+        headers = {"Authorization": f"Bearer {api_key}"}
+
+        # 1) 생성 요청
+        self._update(job_id, status="SUBMITTING")
+        # 생성 요청은 429(거절)일 때만 재시도 → 중복 과금 방지
+        r = await self.http.arequest(
+            self._http(), "suno.generate", "POST", "/generate",
+            retry_statuses=(429,), headers=headers, json=payload,
+        )
+        r.raise_for_status()
+        j = r.json()
+        if j.get("code") != 200 or "data" not in j or "taskId" not in (j["data"] or {}):
+            raise RuntimeError(f"Suno generate 응답 비정상: {j}")
+        task_id = j["data"]["taskId"]
+        self._update(job_id, task_id=task_id, status="PENDING")
+
+        # 2) 상태 폴링
+        await self._poll(job_id, task_id, api_key)
+
+    async def _fetch_record_info(self, task_id: str, api_key: str) -> dict | None:
+        """
+        record-info 1회 조회 (전역 초당 상한 + 동시 요청 슬롯). 폴링/재확인이 함께 쓴다.
+        200이 아니면 None, 네트워크 오류는 httpx.HTTPError 그대로.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._workers)
+        await self._limiter.acquire()
+        async with self._slots:
+            q = await self.http.arequest(
+                self._http(), "suno.record_info", "GET", "/generate/record-info",
+                headers={"Authorization": f"Bearer {api_key}"}, params={"taskId": task_id},
+            )
         if q.status_code != 200:
-            continue
-        info = q.json()
-        data = (info or {}).get("data", {})
-        status = data.get("status", "")
-        resp = (data.get("response") or {})
-        items = (resp.get("sunoData") or [])  # 여러 트랙이 올 수 있음
-
-        # URL 추출
-        for it in items:
-            stream_url = stream_url or it.get("streamAudioUrl")
-            audio_url = audio_url or it.get("audioUrl")
-            cover      = cover or it.get("imageUrl")
-
-        if status in ("FIRST_SUCCESS", "SUCCESS") and (stream_url or audio_url):
-            break
-        if status in ("CREATE_TASK_FAILED", "GENERATE_AUDIO_FAILED", "SENSITIVE_WORD_ERROR"):
-            raise RuntimeError(f"Suno 작업 실패: status={status}, info={info}")
-
-    if not (stream_url or audio_url):
+            return None
+        info = q.json() or {}
+        data = info.get("data") or {}
+        items = (data.get("response") or {}).get("sunoData") or []  # 여러 트랙이 올 수 있음
+
+        def first(field):
+            return next((it[field] for it in items if it.get(field)), None)
+
+        return {
+            "status": data.get("status", ""),
+            "stream_url": first("streamAudioUrl"),
+            "audio_url": first("audioUrl"),
+            "cover": first("imageUrl"),
+            "info": info,
+        }
+
+    async def _poll(self, job_id: str, task_id: str, api_key: str):
+        """
+        record-info 폴링. 2단계로 진행:
+        1) streamAudioUrl 도착(FIRST_SUCCESS) → 바로 재생 가능 (done=False 유지)
+        2) audioUrl(MP3) 도착까지 계속 폴링 → done=True
+        """
+        job = self.get(job_id) or {}
+        stream_url, audio_url, cover = job.get("stream_url"), job.get("audio_url"), job.get("cover")
+        created_at = job.get("created_at") or time.time()
+        stream_at = job.get("stream_at")
+        polls = job.get("polls") or 0
+        started = time.time()
+        deadline = started + self.stream_timeout + (self.mp3_timeout if stream_url else 0)
+        attempt = 0  # 현재 단계 안에서의 폴링 횟수
+        while True:
+            now = time.time()
+            if stream_url:
+                phase, phase_start = "mp3", (stream_at or now)
+            else:
+                phase, phase_start = "stream", created_at
+            delay = self.scheduler.next_delay(phase, now - phase_start, attempt)
+            if now + delay > deadline:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+            try:
+                rec = await self._fetch_record_info(task_id, api_key)
+            except httpx.HTTPError:
+                continue
+            polls += 1
+            self._update(job_id, polls=polls)
+            if rec is None:
+                continue
+            status = rec["status"]
+            stream_url = stream_url or rec["stream_url"]
+            audio_url = audio_url or rec["audio_url"]
+            cover = cover or rec["cover"]
+            self._update(job_id, status=status or "PENDING", stream_url=stream_url, audio_url=audio_url, cover=cover)
+
+            now = time.time()
+            if (stream_url or audio_url) and not stream_at:
+                # 스트리밍 시작 → 지연 분포 학습, MP3 단계로 전환하며 대기 시간 연장
+                stream_at = now
+                self.scheduler.observe("stream", stream_at - created_at)
+                self._update(job_id, stream_at=stream_at)
+                deadline = max(deadline, now + self.mp3_timeout)
+                attempt = 0
+            if audio_url:
+                # MP3까지 준비됨 → 작업 완료
+                self.scheduler.observe("mp3", now - stream_at)
+                self._update(job_id, mp3_at=now, done=True)
+                if self.result_cache is not None and job.get("payload_hash"):
+                    self.result_cache.put(job["payload_hash"], stream_url, audio_url, cover)
+                self._audio_ready(job_id, audio_url, job.get("payload_hash"))
+                return
+            if status in SUNO_FAILED_STATUSES:
+                raise RuntimeError(f"Suno 작업 실패: status={status}, info={rec['info']}")
+
+        if stream_url:
+            raise TimeoutError("스트리밍은 가능하지만 MP3 파일이 제시간에 준비되지 않았습니다.")
         raise TimeoutError("Suno API가 제시간에 트랙 URL을 반환하지 못했습니다.")
 
-    return {"stream_url": stream_url, "audio_url": audio_url, "cover": cover}
+    def _recheck_due(self, job: dict, now: float) -> bool:
+        """시간 초과 작업 재확인 시점인지 (작업 나이의 1/4 간격 → 오래된 작업일수록 드물게)"""
+        age = now - (job["created_at"] or now)
+        interval = min(SUNO_RECHECK_MAX_SEC, max(SUNO_RECHECK_MIN_SEC, age / 4))
+        return now - (job["updated_at"] or 0) >= interval
+
+    async def _recheck(self, job: dict):
+        """
+        시간 초과 작업의 record-info를 한 번만 조회. MP3가 나와 있으면 성공으로 바꾸고
+        결과 캐시/프리패치까지 이어준다. 아직이면 updated_at만 갱신해 다음 재확인을 미룬다.
+        """
+        job_id = job["job_id"]
+        try:
+            rec = await self._fetch_record_info(job["task_id"], self.api_key_fn()) or {}
+            status = rec.get("status", "")
+            stream_url = job["stream_url"] or rec.get("stream_url")
+            audio_url = job["audio_url"] or rec.get("audio_url")
+            cover = job["cover"] or rec.get("cover")
+            fields = {"polls": (job["polls"] or 0) + 1, "stream_url": stream_url, "cover": cover}
+            if audio_url:
+                fields.update(status=status or "SUCCESS", audio_url=audio_url, error=None, done=True,
+                              stream_at=job["stream_at"] or time.time(), mp3_at=time.time())
+            elif status in SUNO_FAILED_STATUSES:
+                fields.update(status=status)  # 더 이상 TIMEOUT이 아니므로 재확인 대상에서 빠짐
+            with self._lock:
+                self._jobs.setdefault(job_id, job)
+            self._update(job_id, **fields)
+            if audio_url:
+                self.recovered += 1
+                if self.result_cache is not None and job["payload_hash"]:
+                    self.result_cache.put(job["payload_hash"], stream_url, audio_url, cover)
+                self._audio_ready(job_id, audio_url, job["payload_hash"])
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._rechecking.discard(job_id)
+
+    async def _reconcile_forever(self):
+        """
+        미완료 작업을 주기적으로 점검 → taskId가 있으면 폴링 재개.
+        시간 초과 작업은 보관 기간 동안 백오프 간격으로 한 번씩 재확인한다.
+        """
+        while True:
+            try:
+                now = time.time()
+                for job in self.store.pending():
+                    job_id = job["job_id"]
+                    if job["done"]:
+                        with self._lock:
+                            if job_id in self._running or job_id in self._rechecking:
+                                continue
+                            if not self._recheck_due(job, now):
+                                continue
+                            self._rechecking.add(job_id)
+                        asyncio.ensure_future(self._recheck(job))
+                        continue
+                    with self._lock:
+                        if job_id in self._running:
+                            continue
+                        self._jobs[job_id] = job
+                    if job["task_id"]:
+                        self.resume(job_id)
+                    else:
+                        # taskId를 받기 전에 프로세스가 죽은 작업: 이중 과금 방지를 위해 재제출하지 않음
+                        self._update(job_id, status="ERROR", done=True,
+                                     error="제출 중 서버가 재시작되어 작업을 확인할 수 없습니다. 다시 생성해 주세요.")
+            except Exception:
+                pass
+            await asyncio.sleep(self.reconcile_every)
+
+
+@st.cache_resource
+def get_suno_engine() -> SunoJobEngine:
+    # 프로세스 전체에서 엔진(이벤트 루프) 하나만 공유
+    return SunoJobEngine(
+        SunoJobStore(SUNO_JOB_DB),
+        http=get_http(),
+        result_cache=get_suno_cache(),
+        on_audio_ready=get_audio_prefetcher().start,
+    )
+
+
+# 추측 실행(가사 생성 직후 미리 Suno 제출) 기본값/세션당 최대 제출 수
+SUNO_SPECULATIVE_DEFAULT = os.environ.get("SUNO_SPECULATIVE", "").lower() in ("1", "true", "yes")
+SUNO_SPECULATIVE_MAX_PER_SESSION = int(os.environ.get("SUNO_SPECULATIVE_MAX_PER_SESSION", 3))
+
+
+class SpeculationStats:
+    """추측 실행 지표: 제출 수, 재생 버튼이 그대로 이어받은 수(hit), 버려진 수(wasted)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"submitted": 0, "hits": 0, "wasted": 0}
+
+    def count(self, event: str):
+        with self._lock:
+            self._counts[event] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self._counts)
+        n = c["submitted"]
+        return {
+            **c,
+            "hit_rate": round(c["hits"] / n, 3) if n else None,
+            "wasted_rate": round(c["wasted"] / n, 3) if n else None,
+        }
+
+
+@st.cache_resource
+def get_speculation_stats() -> SpeculationStats:
+    return SpeculationStats()
+
+
+# -----------------------------
+# 부분 재실행(폴링) 헬퍼
+# -----------------------------
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def polling_fragment(run_every: float):
+    """
+    run_every초마다 해당 블록만 다시 그리는 데코레이터.
+    st.fragment 미지원 버전에서는 잠깐 쉬었다가 전체 rerun으로 대체.
+    (대기 중인 작업이 있을 때만 호출할 것)
+    """
+    def deco(fn):
+        if _st_fragment is not None:
+            return _st_fragment(run_every=run_every)(fn)
+
+        def fallback(*args, **kwargs):
+            fn(*args, **kwargs)
+            time.sleep(run_every)
+            st.rerun()
+        return fallback
+    return deco
+
+
+@polling_fragment(run_every=2)
+def render_suno_progress(job_id: str):
+    job = get_suno_engine().get(job_id)
+    if job is None or job["done"]:
+        st.rerun()  # 완료 → 전체 화면 갱신
+    elapsed = int(time.time() - job["created_at"])
+    st.info(f"⏳ Suno AI로 음악 생성 중... (상태: {job['status']}, {elapsed}초 경과 · 스트리밍 준비까지 1분 30초 예상)")
+    if job["stream_url"] or job["audio_url"]:
+        st.rerun()  # 스트리밍 가능 → 바로 재생
+
+
+@polling_fragment(run_every=3)
+def render_mp3_progress(job_id: str):
+    job = get_suno_engine().get(job_id)
+    if job is None or job["done"] or job["audio_url"]:
+        st.rerun()  # MP3 도착 → 다운로드 버튼 표시
+    st.caption("🎧 스트리밍 재생 중 · MP3 파일을 마무리하는 중이에요. 준비되면 다운로드 버튼이 나타나요.")
+
+
+@polling_fragment(run_every=1)
+def render_lyrics_upgrade(lyrics_job_id: str):
+    job = get_lyrics_service().get(lyrics_job_id)
+    if job is None or job["done"]:
+        st.rerun()  # AI 가사 도착 → 교체
+    st.caption("✨ 템플릿 가사를 먼저 보여드려요. AI 가사가 완성되면 자동으로 바꿔드릴게요.")
+
+
+@polling_fragment(run_every=1)
+def render_prefetch_progress(url: str):
+    state = get_audio_prefetcher().get(url)
+    if state is None or state["status"] in ("done", "error"):
+        st.rerun()  # 다운로드 끝 → 버튼 표시
+    if state["total"]:
+        pct = min(1.0, state["bytes"] / state["total"])
+        st.progress(pct, text=f"💾 MP3 준비 중... {state['bytes'] // 1024:,} / {state['total'] // 1024:,} KB")
+    else:
+        st.caption(f"💾 MP3 준비 중... {state['bytes'] // 1024:,} KB")
 
 
 
 # -----------------------------
 # (모의) 음악 생성: 사인파
 # -----------------------------
+def sine_music_blocks(duration_sec=8, sample_rate=22050, base_freq=440.0, tremolo=0.25, block_size=8192):
+    """사인파 데모를 float32 블록으로 생성. 절대 시간 기준이라 블록 경계에서도 위상이 이어짐"""
+    n = int(sample_rate * duration_sec)
+    peak = 0.6 + tremolo  # |sin × (0.6 + tremolo·sin)|의 최댓값 → 전체를 보지 않고 정규화
+    for start in range(0, n, block_size):
+        idx = np.arange(start, min(start + block_size, n), dtype=np.float64)
+        t = idx / sample_rate
+        freq = base_freq * (1 + 0.02 * idx / max(n - 1, 1))
+        wave_arr = np.sin(2 * np.pi * freq * t) * (0.6 + tremolo * np.sin(2 * np.pi * 3 * t))
+        yield (wave_arr / peak).astype(np.float32)
+
+
 def generate_sine_music_bytes(duration_sec=8, sample_rate=22050, base_freq=440.0, tremolo=0.25):
-    t = np.linspace(0, duration_sec, int(sample_rate * duration_sec), endpoint=False)
-    glide = np.linspace(0, 1, t.size)
-    freq = base_freq * (1 + 0.02 * glide)
-    wave_arr = np.sin(2 * np.pi * freq * t) * (0.6 + tremolo * np.sin(2 * np.pi * 3 * t))
-    wave_arr = (wave_arr / np.max(np.abs(wave_arr)) * 32767).astype(np.int16)
-    buf = BytesIO()
-    with wave.open(buf, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(wave_arr.tobytes())
-    return buf.getvalue()
+    import synth
+
+    blocks = sine_music_blocks(duration_sec, sample_rate, base_freq, tremolo)
+    return b"".join(synth.stream_wav(blocks, int(sample_rate * duration_sec), sample_rate))
 
 def mbti_to_freq(mbti: str):
     base = {
@@ -710,6 +3085,165 @@ def mbti_to_freq(mbti: str):
     return base.get(mbti, 440.0)
 
 
+# -----------------------------
+# 오프라인 합성 곡 (Suno 실패/시간 초과 시 대체)
+# -----------------------------
+OFFLINE_SONG_SEC = 30.0
+
+
+OFFLINE_PREVIEW_DIR = os.environ.get("OFFLINE_PREVIEW_DIR", os.path.join(AUDIO_STORE_DIR, "previews"))
+# 시작 시 16개 전부 미리 합성할지 (기본 꺼짐: 첫 폴백 때 그 MBTI만 합성하고 이후 재사용)
+OFFLINE_PREVIEW_PRECOMPUTE = os.environ.get("OFFLINE_PREVIEW_PRECOMPUTE", "0") == "1"
+
+
+def stream_offline_song(mbti: str, duration_sec: float = OFFLINE_SONG_SEC):
+    """MBTI 스타일/오디오 힌트로 로컬 합성한 미리듣기 곡 (WAV bytes 조각, 보컬 없음)"""
+    import synth  # numpy를 쓰므로 필요할 때만 import
+
+    seed = int(hashlib.sha256(mbti.encode()).hexdigest()[:8], 16)
+    return synth.stream_preview_wav(_mbti_audio_hints(mbti), base_freq=mbti_to_freq(mbti),
+                                    duration_sec=duration_sec, seed=seed)
+
+
+def offline_preview_fingerprint() -> str:
+    """미리듣기 소리를 결정하는 모든 입력의 해시 (스타일 맵/힌트/주파수/합성 파라미터/합성기 코드)"""
+    import synth
+
+    spec = {
+        "style": MBTI_STYLE_MAP,
+        "hints": {m: _mbti_audio_hints(m) for m in MBTI_STYLE_MAP},
+        "freq": {m: mbti_to_freq(m) for m in MBTI_STYLE_MAP},
+        "synth": synth.SYNTH_PARAMS,
+        "sample_rate": synth.SAMPLE_RATE,
+        "duration_sec": OFFLINE_SONG_SEC,
+    }
+    h = hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode())
+    with open(synth.__file__, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+class OfflinePreviewCache:
+    """
+    MBTI별 오프라인 미리듣기 WAV를 한 번만 합성해 디스크 + 메모리에 두고 모든 세션이 같은 bytes를 씀.
+    - 파일명에 fingerprint가 들어가서 스타일 맵/합성 파라미터가 바뀌면 자동으로 새로 합성
+      (다른 fingerprint의 옛 파일은 정리)
+    - 같은 MBTI를 동시에 요청해도 합성은 한 번 (MBTI별 락)
+    - get(): 처음 요청된 MBTI만 합성 → 이후 요청/재시작 후엔 디스크·메모리에서 재사용
+    - precompute(): 백그라운드 스레드에서 16개 전부 미리 준비 (OFFLINE_PREVIEW_PRECOMPUTE=1일 때만)
+    """
+
+    def __init__(self, root: str = OFFLINE_PREVIEW_DIR):
+        self.root = root
+        self._fingerprint: str | None = None
+        self._lock = threading.Lock()
+        self._mbti_locks: dict[str, threading.Lock] = {}
+        self._bytes: dict[str, bytes] = {}
+        self._precompute: threading.Thread | None = None
+        self.hits = 0
+        self.renders = 0
+        self.disk_loads = 0
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def fingerprint(self) -> str:
+        with self._lock:
+            if self._fingerprint is None:
+                self._fingerprint = offline_preview_fingerprint()
+                for name in os.listdir(self.root):
+                    if not name.endswith(f"-{self._fingerprint}.wav"):
+                        os.remove(os.path.join(self.root, name))  # 옛 fingerprint / 중단된 임시 파일
+            return self._fingerprint
+
+    def path(self, mbti: str) -> str:
+        return os.path.join(self.root, f"{mbti}-{self.fingerprint}.wav")
+
+    def get(self, mbti: str) -> bytes:
+        with self._lock:
+            data = self._bytes.get(mbti)
+            if data is not None:
+                self.hits += 1
+                return data
+            mbti_lock = self._mbti_locks.setdefault(mbti, threading.Lock())
+        with mbti_lock:
+            with self._lock:
+                if mbti in self._bytes:
+                    self.hits += 1
+                    return self._bytes[mbti]
+            path = self.path(mbti)
+            if os.path.exists(path):
+                self.disk_loads += 1
+            else:
+                # 블록 단위로 임시 파일에 쓰고 rename (합성 중 메모리는 블록 크기만큼)
+                tmp = f"{path}.{uuid.uuid4().hex}.part"
+                with open(tmp, "wb") as f:
+                    for chunk in stream_offline_song(mbti):
+                        f.write(chunk)
+                os.replace(tmp, path)
+                self.renders += 1
+            with open(path, "rb") as f:
+                data = f.read()
+            with self._lock:
+                self._bytes[mbti] = data
+            return data
+
+    def precompute(self, mbtis=None):
+        """프로세스당 한 번, 백그라운드에서 모든 MBTI 미리듣기를 준비"""
+        with self._lock:
+            if self._precompute is not None:
+                return
+            self._precompute = threading.Thread(
+                target=self._precompute_all, args=(list(mbtis or MBTI_STYLE_MAP),),
+                name="offline-preview-precompute", daemon=True,
+            )
+        self._precompute.start()
+
+    def _precompute_all(self, mbtis: list[str]):
+        for mbti in mbtis:
+            try:
+                self.get(mbti)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": len(self._bytes),
+                "hits": self.hits,
+                "renders": self.renders,
+                "disk_loads": self.disk_loads,
+                "fingerprint": self._fingerprint,
+            }
+
+
+@st.cache_resource
+def get_offline_preview_cache() -> OfflinePreviewCache:
+    return OfflinePreviewCache(OFFLINE_PREVIEW_DIR)
+
+
+def render_offline_song(mbti: str):
+    """Suno 대신 로컬 합성 곡을 재생 + 다운로드 (프로세스 공유 캐시에서 꺼냄)"""
+    st.info("🎹 Suno 대신 로컬에서 합성한 미리듣기 곡이에요 (보컬 없음).")
+    wav_bytes = get_offline_preview_cache().get(mbti)
+    st.audio(wav_bytes, format="audio/wav")
+    st.download_button(
+        "💾 WAV 다운로드",
+        data=wav_bytes,
+        file_name=f"{mbti}_offline_preview.wav",
+        mime="audio/wav",
+        key="offline_song_download",
+    )
+
+
+
+# 인기 (MBTI, 키워드) 조합 가사 캐시 미리 채우기 (LYRICS_WARMUP_TOP_N > 0 일 때만)
+if LYRICS_WARMUP_TOP_N > 0 and OPENAI_AVAILABLE and get_openai_api_key():
+    start_lyrics_warmup(LYRICS_WARMUP_TOP_N)
+
+# MBTI별 오프라인 미리듣기 미리 합성 (옵트인: numpy를 올리고 16곡을 메모리에 두므로 기본은 첫 폴백 때 합성)
+if OFFLINE_PREVIEW_PRECOMPUTE:
+    get_offline_preview_cache().precompute()
+
 
 # -----------------------------
 # 사이드바
@@ -718,11 +3252,67 @@ with st.sidebar:
     st.markdown("### ⚙️ Settings")
     st.caption("OpenAI 키가 없으면 템플릿 가사로 폴백합니다.")
     mode = st.radio("모드 선택", ["가사 생성", "대시보드"])
+    speculative = st.checkbox(
+        "⚡ 가사가 나오면 음악 미리 만들기 (실험)",
+        value=SUNO_SPECULATIVE_DEFAULT,
+        help="가사 생성 직후 Suno 작업을 미리 시작해 재생 버튼 대기 시간을 줄입니다. 가사/보컬을 바꾸면 미리 만든 곡은 버려져요.",
+    )
     st.markdown("---")
     st.markdown("**데이터 수집 항목**")
     st.write("- MBTI/키워드/joy/energy/메모")
     st.write("- 만족도/MBTI 매칭/재생 클릭 여부")
     st.write("- 가사 줄 수/가사 텍스트")
+    with st.expander("🩺 Suno 엔진 상태", expanded=False):
+        st.json(get_suno_engine().stats())
+        st.caption("결과 캐시 / 오디오 저장소")
+        st.json({
+            **get_suno_cache().stats(),
+            "audio_store": get_audio_store().stats(),
+            "prefetch": get_audio_prefetcher().stats(),
+        })
+        st.caption("오프라인 미리듣기 캐시")
+        st.json(get_offline_preview_cache().stats())
+        st.caption("OpenAI 중복 요청 병합 (saved = 아낀 upstream 호출, Suno는 위 coalesced)")
+        st.json(get_singleflight("openai").stats())
+    with st.expander("⚡ 추측 실행 지표", expanded=False):
+        st.json(get_speculation_stats().stats())
+    with st.expander("📝 가사 생성 지표", expanded=False):
+        st.json({**get_lyrics_metrics().summary(), "cache": get_lyrics_cache().stats()})
+    with st.expander("🧾 로그 전송 상태", expanded=False):
+        health = get_sheet_connection().health()
+        icon = {"ok": "🟢", "connecting": "🟡", "error": "🔴"}.get(health["state"], "⚪")
+        st.caption(f"{icon} Google Sheets: {health['state']}")
+        if health["error"]:
+            st.caption(health["error"])
+        if health["state"] == "error" and st.button("시트 다시 연결", key="gsheet_reconnect"):
+            get_sheet_connection().reconnect()
+        st.json(get_sheet_logger().stats())
+        if st.button("미전송 로그 지금 재전송", key="wal_replay"):
+            get_sheet_logger().wake()
+    with st.expander("🌐 HTTP 풀 상태", expanded=False):
+        st.json(get_http().metrics())
+    with st.expander("🐢 import 비용 (콜드 스타트)", expanded=False):
+        st.caption("이 프로세스에 로드된 무거운 모듈: "
+                   + (", ".join(m for m in HEAVY_MODULES if m in sys.modules) or "없음"))
+        if not IMPORT_PROFILE_ENABLED:
+            st.caption("측정은 IMPORT_PROFILE=1 환경변수가 있을 때만 할 수 있어요.")
+        elif st.button("import 시간 측정 (-X importtime)", key="import_profile"):
+            with st.spinner("새 프로세스에서 import 시간 측정 중..."):
+                st.table(import_time_report())
+
+# -----------------------------
+# Suno 작업 재접속 (?job=<job_id>)
+# -----------------------------
+# 새로고침/서버 재시작 후에도 진행 중이던(또는 끝난) 작업에 다시 붙는다
+resume_job_id = get_query_param(qp, "job")
+if resume_job_id and "suno_job_id" not in st.session_state:
+    resumed = get_suno_engine().get(resume_job_id)
+    if resumed:
+        # 작업만 다시 붙인다. session_id는 그대로 (공유/합류된 링크로 남의 세션을 이어받지 않도록)
+        st.session_state["suno_job_id"] = resumed["job_id"]
+        meta = json.loads(resumed.get("meta") or "{}")
+        if meta.get("lyrics") and not st.session_state["lyrics"]:
+            st.session_state["lyrics"] = meta["lyrics"]
 
 # -----------------------------
 # 본문: 두 모드
@@ -794,17 +3384,61 @@ if mode == "가사 생성":
         st.session_state["button_clicks"] += 1
         prompt = make_prompt(mbti, keywords, personal_line, joy, energy)
         use_openai = OPENAI_AVAILABLE and bool(get_openai_api_key())
-        with st.spinner("가사를 빚는 중..."):
-            try:
-                if use_openai:
-                    lyrics = call_openai(prompt)
-                else:
-                    lyrics = fallback_lyrics(mbti, keywords, personal_line, joy, energy)
-            except Exception as e:
-                st.warning(f"OpenAI 호출 실패: {e}\n→ 오프라인 데모 가사로 대체합니다.")
-                lyrics = fallback_lyrics(mbti, keywords, personal_line, joy, energy)
+        clicked_at = time.time()
+        lyrics = ""
+        st.session_state.pop("pending_lyrics_job", None)
+        lyrics_cache = get_lyrics_cache()
+        cache_key = lyrics_cache_key(mbti, keywords, personal_line, joy, energy)
+        if use_openai and (cached := lyrics_cache.get(cache_key)):
+            # 캐시 적중 → 즉시 표시, variant가 부족하면 백그라운드에서 하나 더 채움
+            lyrics = cached
+            if lyrics_cache.needs_fill(cache_key):
+                get_lyrics_service().start(prompt, on_done=lambda text, k=cache_key: lyrics_cache.fill_done(k, text))
+        elif use_openai:
+            # 예산 안에서는 토큰이 오는 대로 흘려 보여주고, 완성본만 세션에 저장
+            service = get_lyrics_service()
+            lyrics_job_id = service.start(prompt, on_done=lambda text, k=cache_key: lyrics_cache.add(k, text))
+            stream_box = st.empty()
+            with stream_box.container():
+                st.caption("가사를 빚는 중...")
+                write_stream(service.iter_until(lyrics_job_id, clicked_at + service.budget))
+            stream_box.empty()
+            lyrics_job = service.get(lyrics_job_id)
+            if lyrics_job["error"]:
+                st.warning(f"OpenAI 호출 실패: {lyrics_job['error']}\n→ 오프라인 데모 가사로 대체합니다.")
+            elif lyrics_job["done"]:
+                lyrics = lyrics_job["text"]
+            else:
+                # 예산 초과 → 템플릿 가사를 먼저 보여주고, AI 가사는 도착하면 교체
+                st.session_state["pending_lyrics_job"] = lyrics_job_id
+                service.metrics.count("budget_exceeded")
+        if not lyrics:
+            lyrics = fallback_lyrics(mbti, keywords, personal_line, joy, energy)
+        get_lyrics_metrics().record_click(time.time() - clicked_at)
         st.session_state["lyrics"] = lyrics
         st.session_state["played"] = False  # 새 가사 생성 시 재생 상태 초기화
+        st.session_state.pop("suno_job_id", None)
+        if st.session_state.pop("spec_job", None):
+            get_speculation_stats().count("wasted")
+        for k in ("audio_url", "mp3_url", "cover_url", "audio_key", "play_local", "suno_cache_key", "offline_song"):
+            st.session_state.pop(k, None)
+        set_query_param("job", "")
+
+    # 예산 초과로 템플릿을 먼저 보여준 경우: AI 가사가 오면 교체 (음악 생성으로 넘어갔으면 폐기)
+    if pending_lyrics := st.session_state.get("pending_lyrics_job"):
+        service = get_lyrics_service()
+        lyrics_job = service.get(pending_lyrics)
+        moved_on = st.session_state.get("played") or st.session_state.get("suno_job_id")
+        if moved_on or lyrics_job is None or lyrics_job["error"]:
+            st.session_state.pop("pending_lyrics_job", None)
+            service.metrics.count("upgrade_discarded")
+        elif lyrics_job["done"]:
+            st.session_state["lyrics"] = lyrics_job["text"]
+            st.session_state.pop("pending_lyrics_job", None)
+            service.metrics.count("upgraded")
+            st.toast("✨ AI 가사가 도착해서 바꿔드렸어요!")
+        else:
+            render_lyrics_upgrade(pending_lyrics)
 
     # 결과 영역
     if st.session_state["lyrics"]:
@@ -824,65 +3458,179 @@ if mode == "가사 생성":
         #     st.audio(wav_bytes, format="audio/wav")
         #     st.caption("※ 재생 버튼 클릭이 데이터로 기록됩니다.")
         st.subheader("Music (Suno AI)")
+        suno_job = None
+        if st.session_state.get("suno_job_id"):
+            suno_job = get_suno_engine().get(st.session_state["suno_job_id"])
+        # 스트리밍 URL이 나오는 즉시 재생 단계로 (MP3는 백그라운드에서 계속 대기)
+        if not st.session_state.get("played") and suno_job and (suno_job["stream_url"] or suno_job["audio_url"]):
+            st.session_state["audio_url"] = suno_job["stream_url"] or suno_job["audio_url"]
+            st.session_state["cover_url"] = suno_job.get("cover")
+            st.session_state["suno_cache_key"] = suno_job["payload_hash"]
+            st.session_state["played"] = True
+
+        # ⚡ 추측 실행: 재생 버튼을 누르기 전에 지금 가사/보컬 기준으로 Suno 작업을 미리 제출
+        spec = st.session_state.get("spec_job")
+        if (speculative and not st.session_state.get("played") and not suno_job
+                and not st.session_state.get("pending_lyrics_job")):
+            spec_payload = build_suno_payload(
+                lyrics=st.session_state["lyrics"],
+                mbti=mbti,
+                title=f"{mbti} - {mbti_style(mbti)['genre']}",
+                vocal_gender=vocal_gender
+            )
+            spec_hash = suno_payload_hash(spec_payload)
+            # 가사가 처음 보였을 때의 설정으로만 미리 제출 (MBTI/보컬을 바꿔 볼 때마다 유료 작업이 나가지 않도록)
+            target = st.session_state.get("spec_target")
+            if not target or target["lyrics"] != st.session_state["lyrics"]:
+                target = {"lyrics": st.session_state["lyrics"], "hash": spec_hash}
+                st.session_state["spec_target"] = target
+            api_key = get_suno_api_key()
+            spec_count = st.session_state.get("spec_count", 0)
+            # 이미 제출한 작업은 재생 버튼(hit/wasted) 또는 새 가사(wasted)에서 정산
+            if (spec is None and spec_hash == target["hash"] and api_key
+                    and spec_count < SUNO_SPECULATIVE_MAX_PER_SESSION
+                    and not get_suno_cache().peek(spec_hash)):
+                spec_job_id = get_suno_engine().submit(
+                    api_key, spec_payload,
+                    session_id=st.session_state["session_id"],
+                    meta={"lyrics": st.session_state["lyrics"], "mbti": mbti, "speculative": True},
+                )
+                st.session_state["spec_job"] = {"job_id": spec_job_id, "hash": spec_hash}
+                st.session_state["spec_count"] = spec_count + 1
+                get_speculation_stats().count("submitted")
+
         if not st.session_state.get("played"):
-            if st.button("▶️ 음악 생성 & 재생", type="primary"):
-                st.session_state["button_clicks"] += 1
-                with st.spinner("Suno AI로 음악 생성 중... (스트리밍 준비까지 1분 30초 예상)"):
-                    try:
-                        out = generate_music_with_suno(
+            if suno_job and not suno_job["done"]:
+                render_suno_progress(suno_job["job_id"])
+            else:
+                if suno_job and suno_job["error"]:
+                    st.error(f"Suno API 실패: {suno_job['error']}")
+                    # 시간 초과여도 taskId가 있으면 결과를 다시 조회할 수 있음
+                    if suno_job["status"] == "TIMEOUT" and suno_job["task_id"]:
+                        if st.button("🔄 상태 새로고침"):
+                            get_suno_engine().resume(suno_job["job_id"])
+                            st.rerun()
+                    render_offline_song(mbti)
+                elif st.session_state.get("offline_song"):
+                    st.error("Suno API 실패: SUNO_API_KEY 가 설정되어 있지 않습니다. secrets.toml의 [suno].api_key 를 확인하세요.")
+                    render_offline_song(mbti)
+                if st.button("▶️ 음악 생성 & 재생", type="primary"):
+                    st.session_state["button_clicks"] += 1
+                    api_key = get_suno_api_key()
+                    if not api_key:
+                        # 오프라인 곡은 위 분기에서만 그린다 (여기서 또 그리면 다운로드 key 중복)
+                        st.session_state["offline_song"] = True
+                        st.rerun()
+                    else:
+                        payload = build_suno_payload(
                             lyrics=st.session_state["lyrics"],
                             mbti=mbti,
                             title=f"{mbti} - {mbti_style(mbti)['genre']}",
                             vocal_gender=vocal_gender
                         )
-                        # 스트리밍이 먼저면 그걸 재생, 없으면 mp3
-                        st.session_state["audio_url"] = out.get("stream_url") or out.get("audio_url")
-                        st.session_state["cover_url"] = out.get("cover")
-                        st.session_state["played"] = True
+                        cache_key = suno_payload_hash(payload)
+                        st.session_state["suno_cache_key"] = cache_key
+                        # 추측 실행 결과는 캐시 조회 전에 정산 (이미 끝나 캐시에 들어간 경우도 hit)
+                        spec = st.session_state.pop("spec_job", None)
+                        spec_hit = bool(spec) and spec["hash"] == cache_key
+                        if spec:
+                            get_speculation_stats().count("hits" if spec_hit else "wasted")
+                        if spec_hit:
+                            # 이어받음 → 이제부터 MP3 프리패치 (이미 도착했으면 바로 시작)
+                            get_suno_engine().claim(spec["job_id"])
+                        # 같은 입력으로 이미 만든 곡이 있으면 즉시 재생
+                        if hit := get_suno_cache().get(cache_key):
+                            # 스트림 URL은 먼저 만료되므로 쓰지 않는다: 저장된 MP3 파일 → MP3 URL 순
+                            st.session_state["audio_url"] = hit["audio_url"]
+                            st.session_state["mp3_url"] = hit["audio_url"]
+                            st.session_state["cover_url"] = hit["cover"]
+                            if hit["audio_key"]:
+                                st.session_state["audio_key"] = hit["audio_key"]
+                                st.session_state["play_local"] = True
+                            st.session_state["played"] = True
+                            st.rerun()
+                        if spec_hit:
+                            # 미리 제출해 둔 작업을 그대로 이어받음
+                            job_id = spec["job_id"]
+                        else:
+                            job_id = get_suno_engine().submit(
+                                api_key, payload,
+                                session_id=st.session_state["session_id"],
+                                meta={"lyrics": st.session_state["lyrics"], "mbti": mbti},
+                            )
+                        st.session_state["suno_job_id"] = job_id
+                        set_query_param("job", job_id)
                         st.rerun()
-                    except Exception as e:
-                        st.error(f"Suno API 실패: {e}")
         else:
-            # 준비된 URL 재생
+            # 준비된 URL 재생 (스트리밍 URL이 먼저 오면 그걸로 바로 재생)
             if url := st.session_state.get("audio_url"):
-                st.audio(url)
+                local = None
+                if st.session_state.get("play_local"):
+                    local = get_audio_store().path(st.session_state.get("audio_key"))
+                if local:
+                    st.audio(local, format="audio/mpeg")
+                else:
+                    st.audio(url)
                 if st.session_state.get("cover_url"):
                     st.image(st.session_state["cover_url"], caption="Cover Art", use_container_width=True)
                 st.caption("※ Suno AI가 생성한 음악입니다.")
 
                 st.warning("⚠️ 생성된 음악은 저장하지 않으면 사라져요. 음악이 마음에 드셨다면 지금 저장해주세요!")
 
-                # MP3 바이트 준비
-                try:
-                    if "audio_bytes" not in st.session_state:
-                        r = requests.get(url, timeout=120)
-                        r.raise_for_status()
-                        st.session_state["audio_bytes"] = r.content
-                except Exception:
-                    pass
+                # 다운로드는 스트림이 아니라 완성된 MP3(audioUrl)에서만 받는다
+                mp3_url = (suno_job or {}).get("audio_url") or st.session_state.get("mp3_url")
+                if mp3_url:
+                    st.session_state["mp3_url"] = mp3_url
+
+                # MP3 파일 준비: 백그라운드 프리패치 상태만 읽는다 (세션엔 AudioStore key만)
+                audio_store = get_audio_store()
+                audio_path = audio_store.path(st.session_state.get("audio_key"))
+                prefetch = None
+                if mp3_url and audio_path is None:
+                    prefetcher = get_audio_prefetcher()
+                    prefetch = prefetcher.get(mp3_url) or prefetcher.start(
+                        mp3_url, st.session_state.get("suno_cache_key")
+                    )
+                    if prefetch["status"] == "done":
+                        st.session_state["audio_key"] = prefetch["audio_key"]
+                        audio_path = audio_store.path(prefetch["audio_key"])
 
                 # 파일명
                 fname = f"{st.session_state.get('song_title','MBTI_Song')}.mp3".replace("/", "_")
 
                 # 🔽 다운로드 버튼: 클릭 로깅 ★
                 clicked = False
-                if "audio_bytes" in st.session_state:
+                if audio_path:
+                    # data는 콜백 → 클릭할 때만 읽으므로 세션마다 MP3를 메모리에 올리지 않는다
+                    audio_key = st.session_state["audio_key"]
                     clicked = st.download_button(
                         "💾 MP3 다운로드",
-                        data=st.session_state["audio_bytes"],
+                        data=lambda key=audio_key: audio_store.read(key),
                         file_name=fname,
                         mime="audio/mpeg"
                     )
-                else:
-                    # 아직 mp3가 준비 전이거나 네트워크 이슈면 링크라도 제공
-                    clicked = st.link_button("🔗 새 탭에서 열기", url)  # ★ link_button도 True/False 반환
+                elif prefetch and prefetch["status"] in ("queued", "downloading"):
+                    render_prefetch_progress(mp3_url)
+                elif mp3_url:
+                    # mp3 다운로드가 네트워크 이슈로 실패하면 링크라도 제공
+                    clicked = st.link_button("🔗 새 탭에서 열기", mp3_url)  # ★ link_button도 True/False 반환
+                    if prefetch and prefetch["status"] == "error" and st.button("🔁 MP3 다시 받기"):
+                        get_audio_prefetcher().start(mp3_url, st.session_state.get("suno_cache_key"), force=True)
+                        st.rerun()
+                elif suno_job and not suno_job["done"]:
+                    render_mp3_progress(suno_job["job_id"])
+                elif suno_job and suno_job["status"] == "TIMEOUT" and suno_job["task_id"]:
+                    st.caption("MP3 파일이 아직 준비되지 않았어요. 서버가 계속 확인하고 있어요.")
+                    if st.button("🔄 상태 새로고침"):
+                        get_suno_engine().resume(suno_job["job_id"])
+                        st.rerun()
 
                 # 클릭 시 상태/통계 업데이트 ★
                 if clicked:
                     st.session_state["download_clicks"] += 1
                     st.session_state["downloaded"] = True
                     # 사이즈 기록(있으면)
-                    st.session_state["audio_size_bytes"] = len(st.session_state.get("audio_bytes", b"") or b"")
+                    st.session_state["audio_size_bytes"] = audio_store.size(st.session_state.get("audio_key"))
 
             else:
                 st.warning("아직 음악 URL이 없습니다.")
@@ -960,7 +3708,8 @@ if mode == "가사 생성":
         )  # ### NEW
         if st.button("🔗 공유하기"):
             # 1) 곡 정보 꺼내기 (없으면 안내)
-            audio_url = st.session_state.get("audio_url", "")
+            # 공유 링크는 완성된 MP3가 있으면 그걸로 (스트림 URL은 더 빨리 만료될 수 있음)
+            audio_url = st.session_state.get("mp3_url") or st.session_state.get("audio_url", "")
             cover_url = st.session_state.get("cover_url", "")
             song_title = st.session_state.get("song_title", f"{mbti} - {mbti_style(mbti)['genre']}")
 
@@ -980,7 +3729,7 @@ if mode == "가사 생성":
                 now_kst = datetime.now(KST)
                 start = st.session_state["start_time"]
                 if getattr(start, "tzinfo", None) is None:
-                    start = KST.localize(start)
+                    start = start.replace(tzinfo=KST)
 
                 payload = {
                     "user_id": user_id.strip(),
@@ -1013,7 +3762,7 @@ if mode == "가사 생성":
                     "audio_size_bytes": int(st.session_state.get("audio_size_bytes", 0)),
                     "vocal_gender": vocal_gender,
                 }
-                append_row_to_sheet(sheet, payload)
+                get_sheet_logger().log(payload)  # 백그라운드에서 묶어서 전송
 
                 # 4) 공유 UI (링크만 표시 / 복사 & 시스템 공유 버튼)
                 html = f"""
@@ -1062,123 +3811,91 @@ if mode == "가사 생성":
 
 elif mode == "대시보드":
     st.header("Dashboard (Live from Google Sheets)")
+    conn = get_sheet_connection()
+    mirror = get_sheet_mirror()
     try:
-        records = sheet.get_all_records()  # expected_headers 제거
-        if not records:
+        # 로컬 미러를 증분 동기화 (TTL 안이면 시트 호출 없음). 시트가 죽어도 미러로 표시
+        try:
+            with st.spinner("Google Sheets 동기화 중..."):
+                mirror.sync(conn.get)
+        except Exception as e:
+            conn.report_error(e)
+            st.warning(f"시트 동기화 실패 — 마지막으로 받은 데이터로 표시합니다: {e}")
+        version = mirror.version()  # (행 수, 마지막 timestamp, 재적재 시각) — 그대로면 아래는 전부 캐시
+        if version[0] == 0:
             st.info("아직 데이터가 없습니다.")
         else:
-            df = pd.DataFrame(records)
-
-            # 숫자형 변환
-            num_cols = [
-                "joy","energy","satisfaction","lyrics_lines",
-                "bo_exhaust","bo_cynicism","bo_burden","bo_anger","bo_fatigue","bo_sleep",
-                "burnout_score","page_view_time","button_clicks"
-            ]
-            for col in num_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-
-
-            # --- 불안정도(번아웃 강도) 계산 & 시각화 --------------------
-            # burnout_score가 있으면 사용, 없으면 개별 문항 합산으로 보정
-            MAX_SCORE = 30  # 6문항 × 5점
-            MIN_SCORE = 6   # 6문항 × 1점
-            bo_cols = ["bo_exhaust","bo_cynicism","bo_burden","bo_anger","bo_fatigue","bo_sleep"]
-
-            # 숫자형 변환(추가)
-            if "burnout_score" in df.columns:
-                df["burnout_score"] = pd.to_numeric(df["burnout_score"], errors="coerce")
-            for c in bo_cols:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors="coerce")
-
-            # 보정 계산: burnout_score가 없거나 전부 NaN이면 개별 문항 합산
-            if "burnout_score" not in df.columns or df["burnout_score"].isna().all():
-                if set(bo_cols).issubset(df.columns):
-                    df["burnout_score"] = df[bo_cols].sum(axis=1)
-
-            if "burnout_score" in df.columns and df["burnout_score"].notna().any():
-                # anxiety_pct 산출 (0~100)
-                df["anxiety_pct"] = (
-                    ((df["burnout_score"] - MIN_SCORE) / (MAX_SCORE - MIN_SCORE)) * 100
-                ).clip(0, 100)
+            data = dashboard_data(mirror, version)
+            agg = data["agg"]  # 적재 시점에 갱신된 MBTI별 평균 (행 수와 무관)
 
+            # --- 불안정도(번아웃 강도) 시각화 --------------------
+            # burnout_score가 있으면 사용, 없으면 개별 문항 합산으로 보정 (_row_metrics)
+            avg_anx = data["anxiety"]
+            if avg_anx is not None:
                 st.subheader("불안정도(Anxiety Index)")
-                avg_anx = float(df["anxiety_pct"].mean())
                 st.metric("평균 불안정도", f"{avg_anx:.1f}%")
                 st.progress(int(round(avg_anx)))
 
                 # MBTI별 번아웃 수준 분포 (파이 차트: 평균 번아웃 점수 비율)
                 st.subheader("MBTI별 번아웃 수준 분포")
-                if "mbti" in df.columns:
-                    burnout_by_mbti = (
-                        df.dropna(subset=["burnout_score"])
-                        .groupby("mbti")["burnout_score"]
-                        .mean()
-                        .sort_values()
-                    )
-                    if not burnout_by_mbti.empty:
-                        # 팔레트 색상 생성 (예: Set3)
-                        colors = cm.Set3(np.linspace(0, 1, len(burnout_by_mbti)))
-
-                        fig, ax = plt.subplots()
-                        ax.pie(
-                            burnout_by_mbti.values,
-                            labels=burnout_by_mbti.index,
-                            autopct="%1.1f%%",
-                            startangle=90,
-                            counterclock=False,
-                            colors=colors
-                        )
-                        st.pyplot(fig)
-                    else:
-                        st.caption("MBTI별 번아웃 평균을 계산할 데이터가 부족합니다.")
+                burnout_by_mbti = agg["burnout_score"].dropna().sort_values()
+                if not burnout_by_mbti.empty:
+                    st.image(render_burnout_pie(
+                        version, tuple(burnout_by_mbti.index), tuple(burnout_by_mbti.values)
+                    ))
                 else:
-                    st.caption("MBTI 컬럼이 없어 MBTI별 분포를 표시할 수 없습니다.")
+                    st.caption("MBTI별 번아웃 평균을 계산할 데이터가 부족합니다.")
 
                 # MBTI별 평균 불안정도 (막대 차트)
-                if "mbti" in df.columns:
-                    st.caption("MBTI별 평균 불안정도")
-                    mbti_avg = (
-                        df.dropna(subset=["anxiety_pct"])
-                        .groupby("mbti")["anxiety_pct"]
-                        .mean()
-                        .sort_values(ascending=False)
-                    )
-                    if not mbti_avg.empty:
-                        st.bar_chart(mbti_avg)
-                    else:
-                        st.caption("불안정도 평균을 계산할 데이터가 부족합니다.")
+                st.caption("MBTI별 평균 불안정도")
+                mbti_avg = agg["anxiety_pct"].dropna().sort_values(ascending=False)
+                if not mbti_avg.empty:
+                    st.bar_chart(mbti_avg)
+                else:
+                    st.caption("불안정도 평균을 계산할 데이터가 부족합니다.")
             else:
                 st.caption("불안정도 데이터를 계산할 수 없습니다.")
             # ------------------------------------------------------------
 
             st.subheader("MBTI별 평균 만족도 (Average Satisfaction)")
-            st.bar_chart(df.groupby("mbti")["satisfaction"].mean())
+            st.bar_chart(agg["satisfaction"])
+
+            st.subheader("일별 기록 수 (Daily rows)")
+            st.line_chart(data["daily"])
 
             st.subheader("MBTI별 키워드 비율 (Keyword Ratio)")
-            if "keywords" in df.columns:
-                kw_dummies = df["keywords"].str.get_dummies(sep=",")
-                kw_by_mbti = pd.concat([df["mbti"], kw_dummies], axis=1).groupby("mbti").sum()
-                st.dataframe(kw_by_mbti)
+            st.dataframe(data["keywords"])  # 적재 시점에 갱신된 희소 카운트
+            if data["pairs"]:
+                st.caption("함께 자주 쓰인 키워드")
+                st.dataframe(pd.DataFrame(data["pairs"], columns=["keyword_a", "keyword_b", "rows"]), hide_index=True)
 
             st.subheader("Joy vs Energy (by MBTI)")
-            st.scatter_chart(df, x="joy", y="energy", color="mbti")
+            # 같은 (joy, energy, mbti) 점은 하나로 모으고 크기로 행 수 표시
+            st.scatter_chart(data["points"], x="joy", y="energy", color="mbti", size="rows")
 
             c1, c2 = st.columns(2)
             with c1:
                 st.subheader("재생 클릭률 (Played rate)")
-                played_rate = (df["played"].astype(str).str.lower().isin(["true","1"])).mean()
+                played_rate = data["played"] or 0.0
                 st.write(f"{played_rate*100:.1f}%")
             with c2:
                 st.subheader("MBTI 매칭 비율 (Matched rate)")
-                match_rate = (df["mbti_match"].astype(str).str.lower().isin(["true","1"])).mean()
+                match_rate = data["mbti_match"] or 0.0
                 st.write(f"{match_rate*100:.1f}%")
             
             st.subheader("최근 데이터 (Latest rows)")
-            st.dataframe(df.tail())
+            st.dataframe(data["tail"])
+
+            with st.expander("🧮 집계 검증 (전체 재계산과 비교)", expanded=False):
+                if st.button("검증 실행", key="agg_check"):
+                    problems = mirror.check_aggregates()
+                    if problems:
+                        st.error(f"집계 불일치 {len(problems)}건")
+                        st.code("\n".join(problems[:50]))
+                    else:
+                        st.success("집계 테이블이 전체 재계산 결과와 일치합니다.")
     except Exception as e:
+        conn.report_error(e)
         st.error(f"대시보드를 불러오지 못했어요: {e}")
 
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+오프라인 합성기 렌더 시간 벤치마크
+
+    python bench_synth.py                 # 30초 / 22.05kHz, 편곡별 5회
+    python bench_synth.py --repeat 20 --budget 0.5
+
+편곡(드럼 패턴 × 코드 음색 × 밝기)마다 렌더 시간을 재서 중앙값/최댓값을 출력하고,
+하나라도 예산(--budget 초)을 넘으면 종료 코드 1로 끝난다.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import synth
+
+# 편곡 조합별 대표 힌트 (렌더 비용은 MBTI가 아니라 편곡에 따라 달라진다)
+CASES = {
+    "four / pad / bright (EDM house, 126bpm)":
+        {"genre": "EDM house", "bpm": 126, "instruments": ["edm drums", "synth bass"], "mood": ["energetic", "fun"]},
+    "backbeat / pluck / bright (hard rock, 124bpm)":
+        {"genre": "hard rock", "bpm": 124, "instruments": ["rock drums", "electric guitar"], "mood": ["driving", "bold"]},
+    "backbeat / piano (soul R&B, 96bpm)":
+        {"genre": "soul R&B", "bpm": 96, "instruments": ["soft keys", "light percussion"], "mood": ["gentle", "hopeful"]},
+    "none / pad (neo-classical, 68bpm)":
+        {"genre": "neo-classical", "bpm": 68, "instruments": ["piano", "strings"], "mood": ["warm", "reflective"]},
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--duration", type=float, default=synth.DURATION_SEC)
+    ap.add_argument("--sample-rate", type=int, default=synth.SAMPLE_RATE)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--budget", type=float, default=1.0, help="렌더 1회 허용 시간(초)")
+    args = ap.parse_args()
+
+    print(f"numpy {np.__version__} | {args.duration:.0f}s @ {args.sample_rate}Hz | repeat {args.repeat}")
+    worst = 0.0
+    for name, hints in CASES.items():
+        synth.render(hints, 440.0, args.duration, args.sample_rate)  # 워밍업
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            synth.render(hints, 440.0, args.duration, args.sample_rate)
+            times.append(time.perf_counter() - t0)
+        worst = max(worst, max(times))
+        print(f"  {name:<48} median {statistics.median(times) * 1000:7.1f} ms   max {max(times) * 1000:7.1f} ms")
+
+    ok = worst <= args.budget
+    print(f"{'PASS' if ok else 'FAIL'}: worst {worst * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+오프라인 합성기 (NumPy 벡터 연산, float32)
+
+Suno가 실패하거나 시간 초과일 때 대신 들려줄 MBTI 미리듣기 곡을 만든다.
+MBTI_STYLE_MAP의 BPM/장르와 _mbti_audio_hints의 악기/무드로 편곡을 정하고,
+코드 진행 + 베이스 + 드럼을 블록 단위 배열 연산으로 렌더링한다 (샘플 단위 파이썬 루프 없음).
+블록을 바로 WAV bytes로 흘려보낼 수 있어 곡 길이와 무관하게 메모리가 일정하다.
+
+streamlit에 의존하지 않아서 bench_synth.py에서 그대로 import해 측정할 수 있다.
+"""
+import struct
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+DURATION_SEC = 30.0
+BLOCK_SIZE = 8192  # 스트리밍 렌더 블록 (샘플 수)
+
+# 반음 단위 코드 진행 (한 마디에 한 코드, 4마디 반복)
+PROGRESSIONS = {
+    "major": ((0, 4, 7), (7, 11, 14), (9, 12, 16), (5, 9, 12)),    # I – V – vi – IV
+    "minor": ((0, 3, 7), (8, 12, 15), (3, 7, 10), (10, 14, 17)),   # i – VI – III – VII
+}
+# 이 무드가 하나라도 있으면 단조
+MINOR_MOODS = ("intimate", "nostalgic", "reflective", "focused", "cinematic",
+               "airy", "thoughtful", "calm", "tender", "dreamy", "cool")
+# 장르 문자열에 포함된 단어 → 드럼 패턴 (위에서부터 먼저 맞는 것, 없으면 backbeat)
+DRUM_PATTERNS = (
+    ("none", ("ambient", "classical", "ballad", "folk")),
+    ("four", ("house", "edm", "dance", "funk", "latin", "city pop")),
+)
+# 악기 이름에 포함된 단어 → 코드 음색 (없으면 piano)
+CHORD_VOICES = (
+    ("pad", ("pad", "strings", "synth")),
+    ("pluck", ("guitar", "pluck")),
+    ("piano", ("piano", "keys")),
+)
+BRIGHT_GENRES = ("rock", "edm", "techno", "electronic", "house")
+MIX = {"chords": 0.45, "bass": 0.35, "kick": 0.6, "snare": 0.25, "hat": 0.08}
+
+# 미리듣기 캐시 무효화용: 소리에 영향을 주는 값은 모두 여기 들어가야 한다
+SYNTH_PARAMS = {
+    "version": 2,
+    "progressions": PROGRESSIONS,
+    "minor_moods": MINOR_MOODS,
+    "drum_patterns": DRUM_PATTERNS,
+    "chord_voices": CHORD_VOICES,
+    "bright_genres": BRIGHT_GENRES,
+    "mix": MIX,
+}
+
+
+def arrangement(hints: dict) -> dict:
+    """오디오 힌트(genre/bpm/instruments/mood) → 편곡 설정"""
+    genre = str(hints.get("genre", "")).lower()
+    instruments = " ".join(hints.get("instruments", [])).lower()
+    moods = set(hints.get("mood", []))
+    drums = next((p for p, words in DRUM_PATTERNS if any(w in genre for w in words)), "backbeat")
+    voice = next((v for v, words in CHORD_VOICES if any(w in instruments for w in words)), "piano")
+    return {
+        "bpm": float(hints.get("bpm", 100)),
+        "mode": "minor" if moods & set(MINOR_MOODS) else "major",
+        "drums": drums,
+        "voice": voice,
+        "bright": any(w in genre for w in BRIGHT_GENRES),
+    }
+
+
+def _attack(tau, sec: float):
+    return np.minimum(tau * np.float32(1.0 / sec), np.float32(1.0))
+
+
+def render_blocks(hints: dict, base_freq: float, duration_sec: float = DURATION_SEC,
+                  sample_rate: int = SAMPLE_RATE, seed: int = 0, block_size: int = BLOCK_SIZE):
+    """
+    미리듣기 곡을 block_size 샘플씩 float32 블록으로 생성하는 제너레이터.
+    모든 소리가 절대 시간의 함수라 블록 경계에서도 위상이 이어지고,
+    메모리는 곡 길이와 무관하게 블록 몇 개 분량으로 일정하다.
+    """
+    arr = arrangement(hints)
+    f32 = np.float32
+    n = int(duration_sec * sample_rate)
+    beat = 60.0 / arr["bpm"]
+    bar = beat * 4
+    step = beat if arr["drums"] == "four" else beat * 2  # 베이스 타격 간격
+    two_pi = f32(2 * np.pi)
+    prog = np.asarray(PROGRESSIONS[arr["mode"]], dtype=f32)
+    root = f32(base_freq / 2)
+    rng = np.random.default_rng(seed)
+    last_noise = f32(0)  # 하이햇 차분 필터의 이전 샘플 (블록 간 연속)
+
+    for start in range(0, n, block_size):
+        # 절대 시간은 float64로 계산하고, 마디/박 안의 경과 시간만 float32로 (긴 곡에서도 정밀도 유지)
+        t64 = np.arange(start, min(start + block_size, n), dtype=np.float64) / sample_rate
+        bar_idx = (t64 // bar).astype(np.int32) % 4
+        beat_idx = (t64 // beat).astype(np.int32) % 4
+        t_bar = np.mod(t64, bar).astype(f32)
+        t_beat = np.mod(t64, beat).astype(f32)
+        t_eighth = np.mod(t64, beat / 2).astype(f32)
+        t_step = np.mod(t64, step).astype(f32)
+
+        # 코드: (블록, 3) 주파수 행렬을 한 번에 사인으로
+        freqs = root * np.exp2(prog[bar_idx] / f32(12))
+        phase = two_pi * freqs * t_bar[:, None]
+        chords = np.sin(phase) + f32(0.3) * np.sin(2 * phase)
+        if arr["bright"]:
+            chords += f32(0.15) * np.sin(3 * phase)
+        chords = chords.sum(axis=1) / f32(3)
+        if arr["voice"] == "pad":
+            env = _attack(t_bar, 0.4) * _attack(f32(bar) - t_bar, 0.2)
+        elif arr["voice"] == "pluck":
+            env = _attack(t_beat, 0.005) * np.exp(-4 * t_beat)
+        else:
+            env = _attack(t_bar, 0.01) * np.exp(f32(-1.2) * t_bar)
+        chords *= env
+
+        # 베이스: 코드 루트 두 옥타브 아래, 반 마디(four 패턴은 한 박)마다 친다
+        bass_freq = root / 2 * np.exp2(prog[bar_idx, 0] / f32(12))
+        bass_phase = two_pi * bass_freq * t_step
+        bass = np.sin(bass_phase) + f32(0.25) * np.sin(2 * bass_phase)
+        bass *= _attack(t_step, 0.01) * np.exp(f32(-3.0) * t_step)
+
+        mix = f32(MIX["chords"]) * chords + f32(MIX["bass"]) * bass
+
+        # 드럼: 킥(주파수 스윕) / 스네어(노이즈) / 하이햇(고역 노이즈)
+        if arr["drums"] != "none":
+            kick_on = True if arr["drums"] == "four" else (beat_idx % 2 == 0)
+            # f(τ) = 45 + 80·e^(-25τ) 의 적분 → 125Hz에서 45Hz로 떨어지는 킥
+            kick_phase = two_pi * (45 * t_beat + f32(80 / 25) * (1 - np.exp(-25 * t_beat)))
+            kick = np.sin(kick_phase) * np.exp(-9 * t_beat) * kick_on
+            noise = rng.standard_normal(t64.size, dtype=f32)
+            snare = noise * np.exp(-18 * t_beat) * (beat_idx % 2 == 1)
+            hat = np.diff(noise, prepend=last_noise) * np.exp(-60 * t_eighth)
+            last_noise = noise[-1]
+            mix += f32(MIX["kick"]) * kick + f32(MIX["snare"]) * snare + f32(MIX["hat"]) * hat
+
+        # 마스터: 페이드 인/아웃 → 소프트 클리핑 (전체 피크를 모르므로 고정 게인)
+        t = t64.astype(f32)
+        fade = _attack(t, 0.02) * _attack(f32(duration_sec) - t, 1.5)
+        yield (f32(0.9) * np.tanh(mix * fade)).astype(f32, copy=False)
+
+
+def render(hints: dict, base_freq: float, duration_sec: float = DURATION_SEC,
+           sample_rate: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """미리듣기 곡 전체를 float32 모노 배열([-1, 1])로 (render_blocks를 이어 붙임)"""
+    blocks = list(render_blocks(hints, base_freq, duration_sec, sample_rate, seed))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def pcm16_blocks(blocks):
+    """float32 [-1, 1] 블록 → 16bit little-endian PCM bytes 블록"""
+    for block in blocks:
+        yield (np.clip(block, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def wav_header(n_frames: int | None, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """
+    16bit 모노 WAV 헤더 (44 bytes). 길이를 알면 정확한 크기를, 모르면(None)
+    스트리밍 관례대로 최댓값(0xFFFFFFFF)을 적어 데이터보다 먼저 보낼 수 있게 한다.
+    """
+    data = 0xFFFFFFFF - 36 if n_frames is None else n_frames * 2
+    return b"".join([
+        b"RIFF", struct.pack("<I", min(0xFFFFFFFF, 36 + data)), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16),
+        b"data", struct.pack("<I", data),
+    ])
+
+
+def stream_wav(blocks, n_frames: int | None, sample_rate: int = SAMPLE_RATE):
+    """헤더 → PCM 블록 순으로 WAV bytes를 흘려보내는 제너레이터 (첫 bytes는 즉시 나옴)"""
+    yield wav_header(n_frames, sample_rate)
+    yield from pcm16_blocks(blocks)
+
+
+def stream_preview_wav(hints: dict, base_freq: float, duration_sec: float = DURATION_SEC,
+                       sample_rate: int = SAMPLE_RATE, seed: int = 0, block_size: int = BLOCK_SIZE):
+    """미리듣기 곡을 WAV bytes 조각으로 스트리밍 (메모리는 블록 크기만큼만)"""
+    blocks = render_blocks(hints, base_freq, duration_sec, sample_rate, seed, block_size)
+    return stream_wav(blocks, int(duration_sec * sample_rate), sample_rate)